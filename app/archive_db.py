@@ -0,0 +1,22 @@
+import argparse
+from datetime import date
+
+from app.database import SessionLocal
+from app.core.archive import archive_past_appointments, prune_expired_slots, BATCH_SIZE
+
+# Uso: python -m app.archive_db [--before YYYY-MM-DD] [--batch-size N]
+parser = argparse.ArgumentParser(description="Archiva citas pasadas y elimina horarios vencidos")
+parser.add_argument("--before", type=date.fromisoformat, default=date.today())
+parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+args = parser.parse_args()
+if args.before > date.today():
+    parser.error("--before no puede ser posterior a hoy")
+
+db = SessionLocal()
+try:
+    archived = archive_past_appointments(db, args.before, args.batch_size)
+    pruned = prune_expired_slots(db, args.before, args.batch_size)
+finally:
+    db.close()
+
+print(f"✅ {archived} citas archivadas y {pruned} horarios vencidos eliminados (antes de {args.before})")
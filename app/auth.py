@@ -2,7 +2,9 @@
 # 📁 app/auth.py — Autenticación local + Google OAuth
 # =========================================================
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import hashlib
+import secrets
 import requests
 
 from fastapi import (
@@ -12,15 +14,14 @@ from fastapi import (
     Request,
     status
 )
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.models import User
-from app.core.security import create_access_token
+from app.models import User, RefreshToken
 
 
 # =========================================================
@@ -31,7 +32,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SECRET_KEY = "clave_secreta_super_segura"  # ⚠️ cámbiala en producción
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ACCESS_TOKEN_EXPIRE_MINUTES = 15   # access token corto: se renueva con el refresh token
+REFRESH_TOKEN_EXPIRE_DAYS = 14
+REFRESH_REUSE_GRACE_SECONDS = 30   # peticiones paralelas con el mismo refresh token
 
 
 # =========================================================
@@ -67,6 +70,127 @@ def decode_access_token(token: str) -> Optional[dict]:
         return None
 
 
+def get_user_id_from_cookie(request: Request) -> Optional[str]:
+    """Devuelve el `sub` del token de la cookie sin consultar la base de datos."""
+    token = request.cookies.get("access_token")
+    payload = decode_access_token(token) if token else None
+    if not payload or "sub" not in payload:
+        return None
+    return str(payload["sub"])
+
+
+# =========================================================
+# 🔄 REFRESH TOKENS (rotación con detección de reutilización)
+# =========================================================
+def _hash_refresh_token(raw_token: str) -> str:
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+def _new_refresh_token(db: Session, user_id: int, family_id: str) -> str:
+    raw_token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_hash_refresh_token(raw_token),
+        family_id=family_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return raw_token
+
+
+def set_session_cookies(response: Response, access_token: str, refresh_token: Optional[str] = None):
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        httponly=True,
+        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        samesite="lax"
+    )
+    if refresh_token:
+        response.set_cookie(
+            key="refresh_token",
+            value=refresh_token,
+            httponly=True,
+            max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+            samesite="lax"
+        )
+
+
+def issue_session(db: Session, response: Response, user_id: int):
+    """Inicia una sesión nueva: access token corto + refresh token de una familia nueva."""
+    refresh_token = _new_refresh_token(db, user_id, secrets.token_hex(16))
+    db.commit()
+    set_session_cookies(response, create_access_token(data={"sub": str(user_id)}), refresh_token)
+
+
+def rotate_refresh_token(db: Session, raw_token: str) -> Optional[Tuple[int, Optional[str]]]:
+    """
+    Canjea un refresh token por uno nuevo con una sola búsqueda indexada.
+
+    Devuelve (user_id, nuevo_refresh_token) o None si el token no es válido.
+    Si se presenta un token ya rotado fuera del margen de gracia, se considera
+    robado y se revoca toda su familia. Dentro del margen (peticiones paralelas
+    del mismo navegador) se devuelve el usuario sin rotar otra vez. El margen
+    solo cubre tokens rotados: nunca los de una familia revocada por logout o
+    por reutilización.
+    """
+    token = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.token_hash == _hash_refresh_token(raw_token))
+        .with_for_update()
+        .first()
+    )
+    if not token:
+        return None
+
+    now = datetime.utcnow()
+    if token.revoked_at is not None:
+        if (
+            token.rotated_at is not None
+            and now - token.rotated_at <= timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS)
+            and not _family_revoked(db, token.family_id)
+        ):
+            db.rollback()
+            return token.user_id, None
+        revoke_refresh_family(db, token.family_id)
+        return None
+
+    if token.expires_at <= now:
+        db.rollback()
+        return None
+
+    token.revoked_at = token.rotated_at = now
+    new_token = _new_refresh_token(db, token.user_id, token.family_id)
+    user_id = token.user_id
+    db.commit()
+    return user_id, new_token
+
+
+def _family_revoked(db: Session, family_id: str) -> bool:
+    """La familia se revocó si tiene un token anulado sin haber sido rotado."""
+    return db.query(RefreshToken.id).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.isnot(None),
+        RefreshToken.rotated_at.is_(None)
+    ).first() is not None
+
+
+def revoke_refresh_family(db: Session, family_id: str):
+    """Revoca todos los refresh tokens de una sesión (logout o reutilización)."""
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+
+def revoke_refresh_token(db: Session, raw_token: str):
+    token = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == _hash_refresh_token(raw_token)
+    ).first()
+    if token:
+        revoke_refresh_family(db, token.family_id)
+
+
 # =========================================================
 # 👤 DEPENDENCIAS DE AUTENTICACIÓN
 # =========================================================
@@ -185,15 +309,8 @@ def google_callback(code: str, db: Session = Depends(get_db)):
         db.commit()
         db.refresh(user)
 
-    # 4️⃣ Crear el JWT y guardar cookie
-    jwt_token = create_access_token(data={"sub": str(user.id)}, expires_delta=timedelta(minutes=60))
+    # 4️⃣ Crear el JWT + refresh token y guardar cookies
     response = RedirectResponse(url="/")
-    response.set_cookie(
-        key="access_token",
-        value=jwt_token,
-        httponly=True,
-        max_age=60 * 60,
-        samesite="lax"
-    )
+    issue_session(db, response, user.id)
 
     return response
@@ -0,0 +1,61 @@
+import json
+import timeit
+from datetime import date, time, timedelta
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.schemas import AdminAppointmentOut
+
+# Uso: python -m app.bench_serialization
+# Compara el coste de serializar 10k filas del listado de citas del admin.
+ROWS = 10_000
+REPEAT = 5
+
+start = date(2025, 1, 1)
+rows = [
+    (i, f"Usuario {i}", start + timedelta(days=i % 365), time(8 + i % 10, (i * 5) % 60), "Consulta")
+    for i in range(ROWS)
+]
+adapter = TypeAdapter(List[AdminAppointmentOut])
+
+
+def antes():
+    """Diccionarios con strftime + jsonable_encoder + json.dumps (camino anterior)."""
+    data = [
+        {
+            "id": r[0],
+            "user_name": r[1],
+            "date": r[2].strftime("%Y-%m-%d"),
+            "time": r[3].strftime("%H:%M"),
+            "reason_name": r[4]
+        }
+        for r in rows
+    ]
+    return json.dumps(jsonable_encoder(data)).encode()
+
+
+def modelo_validado():
+    """Validación con el modelo de respuesta + orjson."""
+    data = [
+        {"id": r[0], "user_name": r[1], "date": r[2], "time": r[3].isoformat(timespec="minutes"), "reason_name": r[4]}
+        for r in rows
+    ]
+    return orjson.dumps(adapter.dump_python(adapter.validate_python(data), mode="json", exclude_none=True))
+
+
+def orjson_directo():
+    """Filas planas serializadas directamente con orjson (camino actual de los listados)."""
+    return orjson.dumps([
+        {"id": r[0], "user_name": r[1], "date": r[2], "time": r[3].isoformat(timespec="minutes"), "reason_name": r[4]}
+        for r in rows
+    ])
+
+
+assert json.loads(antes()) == json.loads(orjson_directo()) == json.loads(modelo_validado())
+
+for fn in (antes, modelo_validado, orjson_directo):
+    best = min(timeit.repeat(fn, number=1, repeat=REPEAT))
+    print(f"{fn.__name__:<16} {best * 1000:8.2f} ms / {ROWS} filas")
@@ -0,0 +1,95 @@
+# =========================================================
+# 📁 app/core/archive.py — Separación caliente/frío del histórico de citas
+# =========================================================
+"""
+Las citas pasadas se mueven a `appointments_archive` y los horarios vencidos
+se eliminan, siempre en lotes acotados (cada lote es una transacción corta),
+para que las consultas diarias solo recorran datos vigentes.
+
+Los informes y exportaciones leen el histórico completo con
+`appointment_history()`, que une ambas tablas.
+"""
+from datetime import date
+
+from sqlalchemy import insert, select, union_all, literal
+from sqlalchemy.orm import Session
+
+from app.models import Appointment, AppointmentArchive, AvailableSlot
+from app.core.calendar_feed import touch_calendars
+
+BATCH_SIZE = 1000
+
+_ARCHIVE_COLUMNS = ["id", "user_id", "resource_id", "reason_id", "date", "time", "end_time"]
+
+
+def _check_before(before: date):
+    """Solo se archiva el pasado: una fecha futura movería citas y horarios vigentes."""
+    if before > date.today():
+        raise ValueError("La fecha límite no puede ser posterior a hoy")
+
+
+def archive_past_appointments(db: Session, before: date, batch_size: int = BATCH_SIZE) -> int:
+    """Mueve al archivo las citas con fecha anterior a `before`. Devuelve cuántas movió."""
+    _check_before(before)
+    total = 0
+    while True:
+        rows = (
+            db.query(Appointment.id, Appointment.user_id)
+            .filter(Appointment.date < before)
+            .order_by(Appointment.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        ids = [row[0] for row in rows]
+
+        db.execute(
+            insert(AppointmentArchive).from_select(
+                _ARCHIVE_COLUMNS,
+                select(*[getattr(Appointment, c) for c in _ARCHIVE_COLUMNS])
+                .where(Appointment.id.in_(ids))
+            )
+        )
+        db.query(Appointment).filter(Appointment.id.in_(ids)).delete(synchronize_session=False)
+        touch_calendars(db, {row[1] for row in rows})  # los feeds ya no incluyen estas citas
+        db.commit()
+        total += len(ids)
+
+    return total
+
+
+def prune_expired_slots(db: Session, before: date, batch_size: int = BATCH_SIZE) -> int:
+    """Elimina los horarios con fecha anterior a `before`. Devuelve cuántos borró."""
+    _check_before(before)
+    total = 0
+    while True:
+        ids = [
+            row[0] for row in
+            db.query(AvailableSlot.id)
+            .filter(AvailableSlot.date < before)
+            .order_by(AvailableSlot.id)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+
+        db.query(AvailableSlot).filter(AvailableSlot.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        total += len(ids)
+
+    return total
+
+
+def appointment_history():
+    """Subconsulta con todas las citas (vigentes y archivadas) y la columna `archived`."""
+    hot = select(
+        *[getattr(Appointment, c) for c in _ARCHIVE_COLUMNS],
+        literal(False).label("archived")
+    )
+    cold = select(
+        *[getattr(AppointmentArchive, c) for c in _ARCHIVE_COLUMNS],
+        literal(True).label("archived")
+    )
+    return union_all(hot, cold).subquery("appointment_history")
@@ -0,0 +1,398 @@
+# =========================================================
+# 📁 app/core/availability_index.py — Índice en memoria de disponibilidad
+# =========================================================
+"""
+Índice de disponibilidad por día basado en bitsets.
+
+Cada día de cada recurso (profesional o sala) se representa con enteros de
+Python usados como mapas de bits de ancho fijo: un bit por minuto (1440
+bits ≈ 180 bytes por día). Así las horas "HH:MM" se representan sin pérdida
+y preguntas como "primer horario libre después de X" o "días libres del
+mes" se resuelven con operaciones de bits, sin consultar la base de datos.
+Las entradas se agrupan por recurso y luego por fecha: las consultas de un
+profesional solo recorren sus propios días.
+
+Las citas tienen duración: además de las plazas de cada horario, cada día
+guarda sus intervalos reservados como dos máscaras (minutos en los que
+empieza una cita y minutos que una cita ya empezada sigue ocupando). Con
+ellas, saber qué inicios admiten una cita de N minutos sin solaparse con
+otra cuesta O(log N) operaciones de bits por día.
+
+El índice se construye al arrancar desde `AvailableSlot` y lo mantienen al
+día las rutas de escritura (reserva, cancelación y alta/baja de horarios).
+Es un caché por proceso: la base de datos sigue siendo quien impide el
+sobrecupo. Lo que escriben otros workers, las tareas en segundo plano o un
+cambio directo en la base se recoge con `refresh_if_changed`, que se ejecuta
+cada `AVAILABILITY_REFRESH_SECONDS`.
+
+Para eso cada (recurso, día) tiene una versión en `availability_versions`,
+que un trigger sobre `available_slots` sube una vez por transacción. El
+índice guarda la versión de cada día y cuántas escrituras propias le aplicó
+desde entonces: si la versión de la base coincide con esa suma, todos los
+cambios son de este proceso y no se recarga nada; si no, se recarga solo ese
+día. Una transacción que hace varias escrituras en el mismo día (cancelar y
+promover, operaciones en bloque) no cuadra y provoca una recarga de ese día,
+que es inofensiva. Las versiones y las filas se leen en una misma foto
+(REPEATABLE READ), así que una escritura que se cuela durante la recarga
+descuadra la cuenta y se corrige en la siguiente pasada, nunca se pierde.
+"""
+import threading
+from collections import Counter
+from datetime import date, datetime, time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from decouple import config
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from app.models import Appointment, AvailableSlot, AvailabilityVersion, DEFAULT_DURATION_MINUTES
+
+SlotKey = Tuple[int, date, time]  # (recurso, fecha, hora)
+DayKey = Tuple[int, date]         # (recurso, fecha)
+
+UNIT_MINUTES = 1
+UNITS_PER_DAY = 24 * 60 // UNIT_MINUTES
+DAY_MASK = (1 << UNITS_PER_DAY) - 1
+
+REFRESH_SECONDS = config("AVAILABILITY_REFRESH_SECONDS", default=10, cast=float)  # 0 = desactivado
+
+
+def time_to_unit(t: time) -> int:
+    """Convierte una hora en su posición de bit dentro del día."""
+    return (t.hour * 60 + t.minute) // UNIT_MINUTES
+
+
+def unit_to_time(unit: int) -> time:
+    """Convierte una posición de bit en la hora correspondiente."""
+    minutes = unit * UNIT_MINUTES
+    return time(minutes // 60, minutes % 60)
+
+
+def iter_bits(mask: int):
+    """Recorre las posiciones de los bits activos, de menor a mayor."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def minutes_to_units(minutes: int) -> int:
+    return max(1, -(-minutes // UNIT_MINUTES))
+
+
+def _snapshot(db: Session):
+    """
+    Lee versiones y filas en una misma foto de la base. Debe llamarse con la
+    sesión recién abierta, antes de su primera consulta.
+    """
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+def day_versions(db: Session) -> Dict[DayKey, int]:
+    """Versión de cada (recurso, día) de hoy en adelante; los que no aparecen van por la 0."""
+    rows = db.query(
+        AvailabilityVersion.resource_id,
+        AvailabilityVersion.date,
+        AvailabilityVersion.version
+    ).filter(AvailabilityVersion.date >= date.today()).all()
+    return {(resource_id, day): version for resource_id, day, version in rows}
+
+
+def spread_down(mask: int, width: int) -> int:
+    """OR de `mask >> k` para k en [0, width): cada bit "mira" `width` bits hacia arriba."""
+    result, covered = mask, 1
+    while covered < width:
+        step = min(covered, width - covered)
+        result |= result >> step
+        covered += step
+    return result
+
+
+class _DayState:
+    """Estado de un día: horarios, plazas e intervalos ya reservados."""
+    __slots__ = ("slots", "full", "seats", "intervals", "starts", "tails")
+
+    def __init__(self):
+        self.slots = 0  # bit activo = existe un horario en ese minuto
+        self.full = 0   # bit activo = el horario no tiene plazas libres
+        self.seats: Dict[int, List[int]] = {}  # unidad -> [capacidad, ocupadas]
+        self.intervals: Counter = Counter()   # (inicio, fin) -> número de citas
+        self.starts = 0  # bit activo = empieza alguna cita en ese minuto
+        self.tails = 0   # bit activo = minuto ocupado por una cita que empezó antes
+
+    @property
+    def free(self) -> int:
+        return self.slots & ~self.full
+
+    def add_interval(self, start: int, end: int, delta: int):
+        count = self.intervals[(start, end)] + delta
+        if count > 0:
+            self.intervals[(start, end)] = count
+        else:
+            self.intervals.pop((start, end), None)
+        self.refresh_intervals()
+
+    def refresh_intervals(self):
+        starts = tails = 0
+        for s, e in self.intervals:
+            starts |= 1 << s
+            if e - s > 1:
+                tails |= ((1 << (e - s - 1)) - 1) << (s + 1)
+        self.starts, self.tails = starts, tails
+
+    def bookable(self, units: int) -> int:
+        """
+        Inicios con plaza libre donde cabe una cita de `units` unidades: el
+        minuto no está dentro de otra cita y ninguna otra empieza antes de que
+        termine la nueva (las que empiezan a la misma hora comparten horario).
+        """
+        mask = self.free & ~self.tails
+        if units > 1:
+            mask &= ~spread_down(self.starts >> 1, units - 1)
+        # La cita debe terminar antes de medianoche (como appointment_end): inicio + units < día
+        return mask & ((1 << (UNITS_PER_DAY - units)) - 1)
+
+    def refresh_unit(self, unit: int):
+        bit = 1 << unit
+        capacity, booked = self.seats[unit]
+        if booked >= capacity:
+            self.full |= bit
+        else:
+            self.full &= ~bit
+
+
+def build_days(db: Session, keys: Optional[Iterable[DayKey]] = None) -> Dict[DayKey, _DayState]:
+    """Estado de los días indicados (o de todos desde hoy) leído de la base."""
+    slot_query = db.query(
+        AvailableSlot.resource_id,
+        AvailableSlot.date,
+        AvailableSlot.time,
+        AvailableSlot.capacity,
+        AvailableSlot.booked_count
+    )
+    appt_query = db.query(
+        Appointment.resource_id,
+        Appointment.date,
+        Appointment.time,
+        Appointment.end_time
+    )
+    if keys is None:
+        slot_query = slot_query.filter(AvailableSlot.date >= date.today())
+        appt_query = appt_query.filter(Appointment.date >= date.today())
+    else:
+        keys = list(keys)
+        slot_query = slot_query.filter(tuple_(AvailableSlot.resource_id, AvailableSlot.date).in_(keys))
+        appt_query = appt_query.filter(tuple_(Appointment.resource_id, Appointment.date).in_(keys))
+
+    days: Dict[DayKey, _DayState] = {}
+    for resource_id, slot_date, slot_time, capacity, booked in slot_query.all():
+        state = days.setdefault((resource_id, slot_date), _DayState())
+        unit = time_to_unit(slot_time)
+        state.slots |= 1 << unit
+        state.seats[unit] = [capacity, booked]
+        state.refresh_unit(unit)
+
+    for resource_id, appt_date, start, end in appt_query.all():
+        state = days.setdefault((resource_id, appt_date), _DayState())
+        start_unit = time_to_unit(start)
+        end_unit = time_to_unit(end) if end else start_unit + minutes_to_units(DEFAULT_DURATION_MINUTES)
+        state.intervals[(start_unit, end_unit)] += 1
+    for state in days.values():
+        state.refresh_intervals()
+    return days
+
+
+class DayBitmapIndex:
+    """Índice en memoria de horarios libres por día."""
+
+    def __init__(self):
+        self._resources: Dict[int, Dict[date, _DayState]] = {}  # recurso -> fecha -> estado
+        self._versions: Dict[DayKey, int] = {}  # versión de la base con la que se cargó cada día
+        self._local: Counter = Counter()         # escrituras propias aplicadas desde esa versión
+        self._lock = threading.Lock()
+
+    def _state(self, resource_id: int, slot_date: date) -> Optional[_DayState]:
+        return self._resources.get(resource_id, {}).get(slot_date)
+
+    # -----------------------------------------------------
+    # Carga inicial
+    # -----------------------------------------------------
+    def load(self, db: Session):
+        """Reconstruye el índice desde la base de datos (solo de hoy en adelante)."""
+        _snapshot(db)
+        versions = day_versions(db)
+        resources: Dict[int, Dict[date, _DayState]] = {}
+        for (resource_id, slot_date), state in build_days(db).items():
+            resources.setdefault(resource_id, {})[slot_date] = state
+
+        with self._lock:
+            self._resources = resources
+            self._versions = versions
+            self._local.clear()
+
+    def refresh_if_changed(self, db: Session) -> bool:
+        """
+        Recarga solo los días cuya versión en la base no cuadra con la cargada
+        más las escrituras propias. Devuelve si recargó alguno.
+        """
+        _snapshot(db)
+        remote = day_versions(db)
+        today = date.today()
+        with self._lock:
+            self._drop_past_locked(today)
+            changed: Set[DayKey] = set()
+            for key in remote.keys() | self._local.keys():
+                expected = self._versions.get(key, 0) + self._local[key]
+                if remote.get(key, 0) != expected:
+                    changed.add(key)
+                elif self._local[key]:
+                    # Todo lo nuevo de ese día lo escribió este proceso
+                    self._versions[key] = expected
+                    del self._local[key]
+        if not changed:
+            return False
+
+        days = build_days(db, changed)
+        with self._lock:
+            for key in changed:
+                resource_id, slot_date = key
+                state = days.get(key)
+                if state is not None:
+                    self._resources.setdefault(resource_id, {})[slot_date] = state
+                else:
+                    self._resources.get(resource_id, {}).pop(slot_date, None)
+                self._versions[key] = remote.get(key, 0)
+                self._local.pop(key, None)
+        return True
+
+    def _drop_past_locked(self, today: date):
+        for days in self._resources.values():
+            for slot_date in [d for d in days if d < today]:
+                del days[slot_date]
+        for key in [k for k in self._versions if k[1] < today]:
+            del self._versions[key]
+        for key in [k for k in self._local if k[1] < today]:
+            del self._local[key]
+
+    # -----------------------------------------------------
+    # Rutas de escritura
+    # -----------------------------------------------------
+    def add_slot(self, resource_id: int, slot_date: date, slot_time: time,
+                 capacity: int = 1, booked: int = 0):
+        unit = time_to_unit(slot_time)
+        with self._lock:
+            self._local[(resource_id, slot_date)] += 1
+            state = self._resources.setdefault(resource_id, {}).setdefault(slot_date, _DayState())
+            state.slots |= 1 << unit
+            state.seats[unit] = [capacity, booked]
+            state.refresh_unit(unit)
+
+    def remove_slot(self, resource_id: int, slot_date: date, slot_time: time):
+        unit = time_to_unit(slot_time)
+        with self._lock:
+            self._local[(resource_id, slot_date)] += 1
+            state = self._state(resource_id, slot_date)
+            if not state or unit not in state.seats:
+                return
+            state.slots &= ~(1 << unit)
+            state.full &= ~(1 << unit)
+            del state.seats[unit]
+            if not state.slots and not state.intervals:
+                del self._resources[resource_id][slot_date]
+
+    def book(self, resource_id: int, slot_date: date, slot_time: time, duration: int):
+        """Ocupa una plaza del horario y el intervalo de `duration` minutos."""
+        self._adjust(resource_id, slot_date, slot_time, duration, 1)
+
+    def release(self, resource_id: int, slot_date: date, slot_time: time, duration: int):
+        self._adjust(resource_id, slot_date, slot_time, duration, -1)
+
+    def move(self, old: SlotKey, new: SlotKey, duration: int):
+        """Libera el horario anterior y ocupa el nuevo en un solo paso."""
+        with self._lock:
+            # Una sola transacción: cada día cuenta una vez aunque sea el mismo
+            for key in {old[:2], new[:2]}:
+                self._local[key] += 1
+            self._adjust_locked(*old, duration, -1)
+            self._adjust_locked(*new, duration, 1)
+
+    def _adjust(self, resource_id: int, slot_date: date, slot_time: time, duration: int, delta: int):
+        with self._lock:
+            self._local[(resource_id, slot_date)] += 1
+            self._adjust_locked(resource_id, slot_date, slot_time, duration, delta)
+
+    def _adjust_locked(self, resource_id: int, slot_date: date, slot_time: time,
+                       duration: int, delta: int):
+        unit = time_to_unit(slot_time)
+        state = self._state(resource_id, slot_date)
+        if not state or unit not in state.seats:
+            return
+        seats = state.seats[unit]
+        seats[1] = max(0, min(seats[0], seats[1] + delta))
+        state.refresh_unit(unit)
+        state.add_interval(unit, unit + minutes_to_units(duration), delta)
+
+    # -----------------------------------------------------
+    # Consultas
+    # -----------------------------------------------------
+    def free_mask(self, resource_id: int, slot_date: date, duration: int = 1) -> int:
+        """Inicios donde cabe una cita de `duration` minutos."""
+        with self._lock:
+            state = self._state(resource_id, slot_date)
+            return state.bookable(minutes_to_units(duration)) if state else 0
+
+    def is_free(self, resource_id: int, slot_date: date, slot_time: time, duration: int = 1) -> bool:
+        """Indica si el horario existe, tiene plazas y no lo cubre otra cita."""
+        mask = self.free_mask(resource_id, slot_date, duration)
+        return bool((mask >> time_to_unit(slot_time)) & 1)
+
+    def free_times(self, resource_id: int, slot_date: date, duration: int = 1) -> List[time]:
+        """Horas donde cabe una cita de `duration` minutos, ordenadas."""
+        return [unit_to_time(u) for u in iter_bits(self.free_mask(resource_id, slot_date, duration))]
+
+    def full_times(self, resource_id: int, slot_date: date) -> List[time]:
+        """Horarios existentes sin plazas libres (candidatos a lista de espera), ordenados."""
+        with self._lock:
+            state = self._state(resource_id, slot_date)
+            mask = state.slots & state.full if state else 0
+        return [unit_to_time(u) for u in iter_bits(mask)]
+
+    def slot_times_between(self, resource_id: int, slot_date: date,
+                           start: time, duration: int) -> List[time]:
+        """Horarios existentes en [start, start + duration)."""
+        first = time_to_unit(start)
+        window = ((1 << minutes_to_units(duration)) - 1) << first
+        with self._lock:
+            state = self._state(resource_id, slot_date)
+            mask = state.slots & window if state else 0
+        return [unit_to_time(u) for u in iter_bits(mask)]
+
+    def first_free_after(self, resource_id: int, after: datetime,
+                         duration: int = 1) -> Optional[Tuple[date, time]]:
+        """Primer inicio (a partir de `after`) donde cabe una cita de `duration` minutos."""
+        start_unit = time_to_unit(after.time())
+        units = minutes_to_units(duration)
+        with self._lock:
+            days = self._resources.get(resource_id, {})
+            for slot_date in sorted(d for d in days if d >= after.date()):
+                mask = days[slot_date].bookable(units)
+                if slot_date == after.date():
+                    mask &= DAY_MASK << start_unit
+                if mask:
+                    return slot_date, unit_to_time((mask & -mask).bit_length() - 1)
+        return None
+
+    def free_days(self, resource_id: int, year: int, month: int, duration: int = 1) -> List[date]:
+        """Días del mes en los que cabe al menos una cita de `duration` minutos."""
+        units = minutes_to_units(duration)
+        with self._lock:
+            return sorted(
+                d for d, state in self._resources.get(resource_id, {}).items()
+                if d.year == year and d.month == month
+                and state.bookable(units)
+            )
+
+
+# Instancia compartida por el proceso
+availability_index = DayBitmapIndex()
+
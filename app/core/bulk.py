@@ -0,0 +1,319 @@
+# =========================================================
+# 📁 app/core/bulk.py — Reservas y cancelaciones en lote
+# =========================================================
+"""
+Operaciones en lote para recepción e integraciones: una serie de citas
+(p. ej. sesiones semanales) o la cancelación de un día completo.
+
+Todo el lote se valida y se aplica en una sola transacción con SQL por
+conjuntos: las plazas se ocupan o liberan con un único
+`UPDATE ... FROM (VALUES ...)`, las citas se insertan o borran con una
+sentencia de varias filas y estadísticas y sellos de calendario se
+actualizan con un UPSERT cada uno. Cada elemento devuelve su propio
+resultado; las funciones no hacen commit ni envían correos.
+"""
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Date, Integer, Time, column, delete, func, insert, update, values
+from sqlalchemy.orm import Session
+
+from app.models import Appointment, AvailableSlot, Reason, User
+from app.core.slots import reason_duration, appointment_end, appointment_minutes, lock_resource_days
+from app.core.stats import record_bookings
+from app.core.calendar_feed import touch_calendars
+
+MAX_BULK_ITEMS = 500
+
+
+class BookedItem(NamedTuple):
+    id: int
+    resource_id: int
+    date: date
+    time: time
+    duration: int
+
+
+class CancelledItem(NamedTuple):
+    id: int
+    user_id: int
+    user_name: Optional[str]
+    email: str
+    resource_id: int
+    date: date
+    time: time
+    duration: int
+    reason_name: Optional[str]
+
+
+def _result(day: Optional[str], start: Optional[str], error: Optional[str] = None) -> dict:
+    return {"id": None, "date": day, "time": start, "ok": False, "error": error}
+
+
+# =========================================================
+# 📅 RESERVA EN LOTE
+# =========================================================
+def bulk_book(
+    db: Session,
+    user_id: int,
+    resource_id: int,
+    reason: Optional[Reason],
+    items: Sequence[Tuple[str, str]],
+    repeat: int = 1,
+    every_days: int = 7,
+    all_or_nothing: bool = False
+) -> Tuple[List[dict], List[BookedItem]]:
+    """
+    Reserva para un usuario cada (fecha, hora) de `items`, repetida `repeat`
+    veces cada `every_days` días. Devuelve los resultados por elemento y las
+    citas creadas. Con `all_or_nothing`, un solo fallo deshace el lote.
+    """
+    duration = reason_duration(reason)
+    results: List[dict] = []
+    pending: Dict[Tuple[date, time], dict] = {}  # (día, inicio) -> resultado, en orden
+    ends: Dict[Tuple[date, time], time] = {}
+
+    for raw_date, raw_time in items:
+        try:
+            first_day = datetime.strptime(raw_date, "%Y-%m-%d").date()
+            start = datetime.strptime(raw_time, "%H:%M").time()
+        except ValueError:
+            results.append(_result(raw_date, raw_time, "Formato de fecha u hora inválido"))
+            continue
+        try:
+            end = appointment_end(start, duration)
+        except ValueError as e:
+            results.append(_result(raw_date, raw_time, str(e)))
+            continue
+
+        for n in range(repeat):
+            day = first_day + timedelta(days=n * every_days)
+            result = _result(day.isoformat(), start.strftime("%H:%M"))
+            results.append(result)
+            if (day, start) in pending:
+                result["error"] = "Repetido en la solicitud"
+                continue
+            pending[(day, start)] = result
+            ends[(day, start)] = end
+
+    if not pending:
+        return results, []
+
+    days = sorted({day for day, _ in pending})
+    lock_resource_days(db, [(resource_id, day) for day in days])
+
+    # 1️⃣ Conflictos: dos consultas para todo el lote
+    taken: Dict[date, List[Tuple[time, time]]] = defaultdict(list)
+    for day, start, end in db.query(Appointment.date, Appointment.time, Appointment.end_time).filter(
+        Appointment.resource_id == resource_id,
+        Appointment.date.in_(days)
+    ):
+        taken[day].append((start, end))
+    own = set(
+        db.query(Appointment.date, Appointment.time)
+        .filter(Appointment.user_id == user_id, Appointment.date.in_(days))
+        .all()
+    )
+
+    for (day, start), result in pending.items():
+        end = ends[(day, start)]
+        if (day, start) in own:
+            result["error"] = "El usuario ya tiene una cita en este horario"
+        elif any(s != start and s < end and e > start for s, e in taken[day]):
+            result["error"] = "Se solapa con otra cita"
+        else:
+            taken[day].append((start, end))  # los siguientes del lote también lo tienen en cuenta
+
+    accepted = [key for key, result in pending.items() if result["error"] is None]
+
+    # 2️⃣ Plazas: un único UPDATE condicional para todos los horarios
+    reserved = set()
+    if accepted:
+        wanted = values(column("date", Date), column("time", Time), name="wanted").data(accepted)
+        reserved = {
+            (row[0], row[1]) for row in db.execute(
+                update(AvailableSlot)
+                .where(
+                    AvailableSlot.resource_id == resource_id,
+                    AvailableSlot.date == wanted.c.date,
+                    AvailableSlot.time == wanted.c.time,
+                    AvailableSlot.booked_count < AvailableSlot.capacity
+                )
+                .values(booked_count=AvailableSlot.booked_count + 1)
+                .returning(AvailableSlot.date, AvailableSlot.time)
+                .execution_options(synchronize_session=False)
+            )
+        }
+    for key in accepted:
+        if key not in reserved:
+            pending[key]["error"] = "Horario no disponible"
+
+    if all_or_nothing and any(result["error"] for result in results):
+        db.rollback()
+        for result in results:
+            if result["error"] is None:
+                result["error"] = "No aplicada: otro elemento del lote falló"
+        return results, []
+
+    to_book = [key for key in accepted if key in reserved]
+    if not to_book:
+        return results, []
+
+    # 3️⃣ Citas: un INSERT de varias filas
+    reason_id = reason.id if reason else None
+    rows = db.execute(
+        insert(Appointment)
+        .values([
+            {
+                "user_id": user_id,
+                "resource_id": resource_id,
+                "reason_id": reason_id,
+                "date": day,
+                "time": start,
+                "end_time": ends[(day, start)]
+            }
+            for day, start in to_book
+        ])
+        .returning(Appointment.id, Appointment.date, Appointment.time)
+    ).all()
+
+    booked = []
+    for appt_id, day, start in rows:
+        pending[(day, start)].update(id=appt_id, ok=True)
+        booked.append(BookedItem(appt_id, resource_id, day, start, duration))
+    booked.sort(key=lambda b: (b.date, b.time))
+
+    record_bookings(db, Counter((day, reason_id) for day, _ in to_book))
+    touch_calendars(db, [user_id])
+    return results, booked
+
+
+# =========================================================
+# 🗑️ CANCELACIÓN EN LOTE
+# =========================================================
+def bulk_cancel(
+    db: Session,
+    ids: Optional[Sequence[int]] = None,
+    day: Optional[date] = None,
+    resource_id: Optional[int] = None
+) -> Tuple[List[dict], List[CancelledItem]]:
+    """
+    Cancela las citas indicadas por id, o todas las de un día (opcionalmente
+    de un solo recurso). Devuelve los resultados por elemento y las citas
+    canceladas, con lo necesario para avisar a cada usuario.
+    """
+    query = (
+        db.query(
+            Appointment.id, Appointment.user_id, User.full_name, User.email,
+            Appointment.resource_id, Appointment.date, Appointment.time,
+            Appointment.end_time, Appointment.reason_id, Reason.name
+        )
+        .join(User, User.id == Appointment.user_id)
+        .outerjoin(Reason, Reason.id == Appointment.reason_id)
+    )
+    if ids is not None:
+        query = query.filter(Appointment.id.in_(ids))
+    else:
+        query = query.filter(Appointment.date == day)
+        if resource_id is not None:
+            query = query.filter(Appointment.resource_id == resource_id)
+    rows = query.order_by(Appointment.date, Appointment.time).with_for_update(of=Appointment).all()
+
+    cancelled = [
+        CancelledItem(
+            r[0], r[1], r[2], r[3], r[4], r[5], r[6], appointment_minutes(r[6], r[7]), r[9]
+        )
+        for r in rows
+    ]
+    by_id = {c.id: c for c in cancelled}
+
+    def ok(c: CancelledItem) -> dict:
+        return {"id": c.id, "date": c.date.isoformat(), "time": c.time.strftime("%H:%M"), "ok": True, "error": None}
+
+    if ids is not None:
+        results = [
+            ok(by_id[i]) if i in by_id
+            else {"id": i, "date": None, "time": None, "ok": False, "error": "Cita no encontrada"}
+            for i in dict.fromkeys(ids)
+        ]
+    else:
+        results = [ok(c) for c in cancelled]
+
+    if not cancelled:
+        return results, []
+
+    # Días bloqueados antes de tocar horarios, en el mismo orden que las reservas
+    lock_resource_days(db, [(c.resource_id, c.date) for c in cancelled])
+
+    # 1️⃣ Plazas: un único UPDATE con cuántas se liberan en cada horario
+    freed = Counter((c.resource_id, c.date, c.time) for c in cancelled)
+    released = values(
+        column("resource_id", Integer), column("date", Date), column("time", Time), column("n", Integer),
+        name="released"
+    ).data([(*key, n) for key, n in freed.items()])
+    db.execute(
+        update(AvailableSlot)
+        .where(
+            AvailableSlot.resource_id == released.c.resource_id,
+            AvailableSlot.date == released.c.date,
+            AvailableSlot.time == released.c.time
+        )
+        .values(booked_count=func.greatest(AvailableSlot.booked_count - released.c.n, 0))
+        .execution_options(synchronize_session=False)
+    )
+
+    # 2️⃣ Citas: un DELETE para todas
+    db.execute(
+        delete(Appointment)
+        .where(Appointment.id.in_(list(by_id)))
+        .execution_options(synchronize_session=False)
+    )
+
+    reason_ids = {r[0]: r[8] for r in rows}
+    record_bookings(db, {
+        key: -n for key, n in Counter((c.date, reason_ids[c.id]) for c in cancelled).items()
+    })
+    touch_calendars(db, {c.user_id for c in cancelled})
+    return results, cancelled
+
+
+# =========================================================
+# 📧 CORREOS DEL LOTE
+# =========================================================
+def booking_summary_email(user: User, reason: Optional[Reason], booked: Iterable[BookedItem]):
+    """Un solo correo con todas las citas reservadas para el usuario."""
+    lines = "".join(
+        f"<li>{b.date.strftime('%Y-%m-%d')} {b.time.strftime('%H:%M')}</li>" for b in booked
+    )
+    subject = "Confirmación de tus citas"
+    body = f"""
+    <h3>Hola {user.full_name} 👋</h3>
+    <p>Se han agendado las siguientes citas:</p>
+    <ul>{lines}</ul>
+    <p><b>Motivo:</b> {reason.name if reason else "Sin motivo"}</p>
+    <p>Por favor llega 10 minutos antes de cada cita. ¡Nos vemos pronto!</p>
+    """
+    return user.email, subject, body
+
+
+def cancellation_emails(cancelled: Iterable[CancelledItem]) -> List[Tuple[str, str, str]]:
+    """Un correo por usuario con todas sus citas canceladas."""
+    by_user: Dict[int, List[CancelledItem]] = defaultdict(list)
+    for c in cancelled:
+        by_user[c.user_id].append(c)
+
+    messages = []
+    for items in by_user.values():
+        lines = "".join(
+            f"<li>{c.date.strftime('%Y-%m-%d')} {c.time.strftime('%H:%M')} — {c.reason_name or 'Sin motivo'}</li>"
+            for c in items
+        )
+        body = f"""
+        <h3>Hola {items[0].user_name} 👋</h3>
+        <p>Lamentamos informarte de que se han cancelado las siguientes citas:</p>
+        <ul>{lines}</ul>
+        <p>Puedes reservar un nuevo horario cuando quieras desde la aplicación.</p>
+        """
+        messages.append((items[0].email, "Tus citas han sido canceladas", body))
+    return messages
@@ -0,0 +1,142 @@
+# =========================================================
+# 📁 app/core/calendar_feed.py — Feeds iCalendar (.ics)
+# =========================================================
+"""
+Suscripciones de calendario por usuario y para administradores.
+
+Cada feed tiene un sello de cambios (`CalendarStamp`) que las rutas de
+escritura incrementan en su misma transacción. El ETag y Last-Modified se
+derivan del sello, así que un cliente que sondea cada pocos minutos recibe
+un 304 con una sola lectura por clave primaria, sin reconstruir el feed.
+"""
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.auth import SECRET_KEY
+from app.models import CalendarStamp, DEFAULT_DURATION_MINUTES
+
+ALL_SCOPE = "all"
+DEFAULT_DURATION = timedelta(minutes=DEFAULT_DURATION_MINUTES)  # citas sin hora de fin
+PRODID = "-//CitasApp//Sistema de Citas//ES"
+
+# Clave distinta de la de los JWT: un enlace de calendario no sirve para iniciar sesión
+_FEED_KEY = hashlib.sha256(f"{SECRET_KEY}:calendar-feed".encode()).digest()
+
+
+# =========================================================
+# 🔑 ENLACES FIRMADOS
+# =========================================================
+def feed_token(user_id: int) -> str:
+    signature = hmac.new(_FEED_KEY, str(user_id).encode(), hashlib.sha256).hexdigest()[:32]
+    return f"{user_id}-{signature}"
+
+
+def user_id_from_feed_token(token: str) -> Optional[int]:
+    user_id, _, _ = token.partition("-")
+    if not user_id.isdigit():
+        return None
+    if not hmac.compare_digest(feed_token(int(user_id)), token):
+        return None
+    return int(user_id)
+
+
+# =========================================================
+# 🕒 SELLOS DE CAMBIO
+# =========================================================
+def user_scope(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def touch_calendar(db: Session, user_id: int):
+    """Marca como modificados el feed del usuario y el de administración. No hace commit."""
+    touch_calendars(db, [user_id])
+
+
+def touch_calendars(db: Session, user_ids: Iterable[int]):
+    """Como `touch_calendar` para varios usuarios, con un único UPSERT. No hace commit."""
+    scopes = sorted({user_scope(u) for u in user_ids}) + [ALL_SCOPE]
+    stmt = insert(CalendarStamp).values([
+        {"scope": scope, "version": 1, "updated_at": func.now()} for scope in scopes
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[CalendarStamp.scope],
+        set_={"version": CalendarStamp.version + 1, "updated_at": func.now()}
+    ))
+
+
+def get_stamp(db: Session, scope: str) -> CalendarStamp:
+    stamp = db.get(CalendarStamp, scope)
+    # Sin sello todavía: el feed está vacío desde siempre
+    return stamp or CalendarStamp(scope=scope, version=0, updated_at=datetime(2000, 1, 1))
+
+
+def stamp_etag(stamp: CalendarStamp) -> str:
+    return f'"{stamp.scope}-{stamp.version}"'
+
+
+# =========================================================
+# 📅 GENERACIÓN DEL .ics
+# =========================================================
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Divide líneas de más de 75 octetos como exige RFC 5545."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, current = [], b""
+    for char in line:
+        char_bytes = char.encode()
+        if len(current) + len(char_bytes) > (75 if not parts else 74):
+            parts.append(current.decode())
+            current = b""
+        current += char_bytes
+    parts.append(current.decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_datetime(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def render_calendar(name: str, stamp: CalendarStamp, rows: Iterable) -> Iterator[str]:
+    """
+    Genera el calendario línea a línea a partir de filas
+    (id, fecha, hora, hora de fin, motivo, nombre del usuario).
+    """
+    dtstamp = _ics_datetime(stamp.updated_at) + "Z"
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield f"PRODID:{PRODID}\r\n"
+    yield "CALSCALE:GREGORIAN\r\n"
+    yield _fold(f"X-WR-CALNAME:{_escape(name)}")
+
+    for appt_id, appt_date, appt_time, appt_end, reason_name, user_name in rows:
+        start = datetime.combine(appt_date, appt_time)
+        end = datetime.combine(appt_date, appt_end) if appt_end else start + DEFAULT_DURATION
+        summary = f"Cita: {reason_name or 'Sin motivo'}"
+        if user_name:
+            summary += f" — {user_name}"
+
+        yield "BEGIN:VEVENT\r\n"
+        yield f"UID:cita-{appt_id}@citasapp\r\n"
+        yield f"DTSTAMP:{dtstamp}\r\n"
+        yield f"DTSTART:{_ics_datetime(start)}\r\n"
+        yield f"DTEND:{_ics_datetime(end)}\r\n"
+        yield _fold(f"SUMMARY:{_escape(summary)}")
+        yield "END:VEVENT\r\n"
+
+    yield "END:VCALENDAR\r\n"
@@ -0,0 +1,28 @@
+# =========================================================
+# 📁 app/core/compression.py — Compresión de respuestas dinámicas
+# =========================================================
+"""
+Comprime con gzip las respuestas JSON/HTML que superan `MINIMUM_SIZE`.
+
+Se omiten el stream SSE (debe llegar evento a evento, sin buffer) y `/static`,
+que ya se sirve con variantes precomprimidas al arrancar.
+"""
+from starlette.middleware.gzip import GZipMiddleware
+
+MINIMUM_SIZE = 1024
+EXCLUDED_PATHS = ("/static/", "/appointments/stream")
+
+
+class CompressionMiddleware:
+    """GZip selectivo por ruta."""
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE, exclude_paths=EXCLUDED_PATHS):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=6)
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.exclude_paths):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -4,7 +4,8 @@ from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
 from decouple import config
 
-async def send_email(to_email: str, subject: str, body: str):
+def send_email(to_email: str, subject: str, body: str):
+    # Función normal (smtplib bloquea): BackgroundTasks la ejecuta en el threadpool
     sender_email = config("GMAIL_USER")
     sender_name = "Sistema de Citas"
     password = config("GMAIL_PASS")
@@ -27,3 +28,30 @@ async def send_email(to_email: str, subject: str, body: str):
             print(f"📨 Correo enviado correctamente a {to_email}")
     except Exception as e:
         print(f"❌ Error al enviar correo: {e}")
+
+
+def send_bulk_emails(messages):
+    """
+    Envía varios correos (destinatario, asunto, cuerpo) con una sola conexión SMTP.
+    Es una función normal: BackgroundTasks la ejecuta en el threadpool.
+    """
+    if not messages:
+        return
+    sender_email = config("GMAIL_USER")
+    sender_name = "Sistema de Citas"
+    password = config("GMAIL_PASS")
+
+    try:
+        with smtplib.SMTP("smtp.gmail.com", 587) as server:
+            server.starttls()
+            server.login(sender_email, password)
+            for to_email, subject, body in messages:
+                msg = MIMEMultipart("alternative")
+                msg["From"] = formataddr((sender_name, sender_email))
+                msg["To"] = to_email
+                msg["Subject"] = subject
+                msg.attach(MIMEText(body, "html", "utf-8"))
+                server.sendmail(sender_email, [to_email], msg.as_string())
+        print(f"📨 {len(messages)} correos enviados en lote")
+    except Exception as e:
+        print(f"❌ Error al enviar correos en lote: {e}")
@@ -0,0 +1,87 @@
+# =========================================================
+# 📁 app/core/events.py — Difusión de cambios de disponibilidad (SSE)
+# =========================================================
+"""
+Hub de eventos en memoria para avisar a los clientes cuando un horario se
+ocupa o se libera.
+
+Cada conexión SSE tiene una cola asyncio pequeña y se registra solo en las
+fechas del recurso que está mirando, de modo que publicar un evento cuesta
+O(clientes de ese recurso y fecha) y una conexión inactiva no consume CPU.
+Si un cliente lento llena su cola se descarta el evento más antiguo: el
+siguiente evento (o una recarga de `/appointments/available`) corrige el
+estado.
+"""
+import asyncio
+import json
+from datetime import date, time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.core.availability_index import availability_index
+
+QUEUE_SIZE = 32
+KEEPALIVE_SECONDS = 15
+MAX_DATES_PER_CLIENT = 31
+
+
+class AvailabilityHub:
+    """Reparte eventos por (recurso, fecha) entre las conexiones suscritas."""
+
+    def __init__(self):
+        self._subscribers: Dict[Tuple[int, date], Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Guarda el event loop para poder publicar desde rutas síncronas."""
+        self._loop = loop
+
+    def subscribe(self, resource_id: int, dates: Iterable[date]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        for d in dates:
+            self._subscribers.setdefault((resource_id, d), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, resource_id: int, dates: Iterable[date]):
+        for d in dates:
+            queues = self._subscribers.get((resource_id, d))
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[(resource_id, d)]
+
+    def publish(self, resource_id: int, event_date: date, event: dict):
+        """Publica un evento; se puede llamar desde cualquier hilo."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._dispatch, (resource_id, event_date), event)
+
+    def _dispatch(self, key: Tuple[int, date], event: dict):
+        for queue in self._subscribers.get(key, ()):
+            if queue.full():
+                queue.get_nowait()  # descartar el más antiguo
+            queue.put_nowait(event)
+
+
+# Instancia compartida por el proceso
+availability_hub = AvailabilityHub()
+
+
+def notify_slot_change(resource_id: int, slot_date: date, slot_time: time, duration: int = 1):
+    """
+    Publica el estado actual según el índice en memoria del horario y de los
+    demás horarios que cubre una cita de `duration` minutos que empieza en él.
+    """
+    times = {slot_time, *availability_index.slot_times_between(resource_id, slot_date, slot_time, duration)}
+    for t in sorted(times):
+        free = availability_index.is_free(resource_id, slot_date, t)
+        availability_hub.publish(resource_id, slot_date, {
+            "type": "slot-freed" if free else "slot-taken",
+            "resource_id": resource_id,
+            "date": slot_date.strftime("%Y-%m-%d"),
+            "time": t.strftime("%H:%M")
+        })
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
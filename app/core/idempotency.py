@@ -0,0 +1,206 @@
+# =========================================================
+# 📁 app/core/idempotency.py — Claves de idempotencia (Idempotency-Key)
+# =========================================================
+"""
+Soporte para el encabezado `Idempotency-Key` en las operaciones de reserva
+y cancelación.
+
+La primera respuesta se guarda (estado, tipo de contenido y cuerpo) en un
+almacén en memoria con caducidad y tamaño acotado. Solo se guardan los
+éxitos y los errores de validación; un 401/403, un 409 o un rechazo como
+"Horario no disponible" pueden cambiar al reintentar, así que esos no se
+guardan y el reintento vuelve a ejecutar la ruta. Los reintentos con la
+misma clave devuelven la respuesta guardada sin volver a ejecutar la ruta,
+así que no se repiten consultas ni correos de confirmación. Si llega un
+duplicado mientras la primera petición sigue en curso, espera su resultado
+en lugar de competir con ella.
+
+El almacén es de cada proceso: con varios workers, un reintento que llega a
+otro worker vuelve a ejecutar la ruta. La reserva no se duplica porque la
+comprobación de "ya tienes una cita" se hace con el día del recurso
+bloqueado (el reintento recibe ese error, sin segundo correo), y cancelar una
+cita ya cancelada devuelve 404.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.auth import get_user_id_from_cookie
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENT_PATHS = (
+    "/appointments/create",
+    "/appointments/cancel/",
+    "/appointments/reschedule/",
+    "/admin/appointments/bulk-"
+)
+TTL_SECONDS = 24 * 60 * 60
+MAX_ENTRIES = 10_000
+WAIT_SECONDS = 30
+MAX_KEY_LENGTH = 255
+CACHEABLE_CLIENT_ERRORS = (400, 404, 422)  # errores de validación: repetir daría lo mismo
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response", "expires_at")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+        self.response: Optional[Tuple[int, str, bytes]] = None  # (estado, content-type, cuerpo)
+        self.expires_at = 0.0  # se fija al guardar la respuesta
+
+
+class IdempotencyStore:
+    """
+    Almacén en memoria de respuestas por clave, con caducidad y tamaño acotado.
+
+    Las peticiones en curso y las respuestas guardadas van en estructuras
+    separadas: las guardadas se ordenan por momento de guardado, así que
+    se descartan de la más antigua a la más nueva (caducadas o sobrantes) y
+    una petición lenta en curso nunca impide aplicar el límite.
+    """
+
+    def __init__(self, ttl_seconds: int = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._pending: Dict[str, _Entry] = {}
+        self._completed: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[_Entry, bool]:
+        """Devuelve la entrada de la clave y si esta petición es la que debe ejecutarse."""
+        self._purge()
+        entry = self._pending.get(key) or self._completed.get(key)
+        if entry is not None:
+            return entry, False
+
+        entry = _Entry(fingerprint)
+        self._pending[key] = entry
+        return entry, True
+
+    def complete(self, key: str, status_code: int, media_type: str, body: bytes):
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        entry.response = (status_code, media_type, body)
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+        self._completed[key] = entry
+        entry.done.set()
+
+    def abort(self, key: str):
+        """Descarta una ejecución sin respuesta guardable para que un reintento pueda repetirla."""
+        entry = self._pending.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+    def _purge(self):
+        """Elimina desde la más antigua las respuestas caducadas o que exceden el límite."""
+        now = time.monotonic()
+        while self._completed:
+            key, entry = next(iter(self._completed.items()))
+            if entry.expires_at > now and len(self._completed) < self.max_entries:
+                break
+            del self._completed[key]
+
+
+def _cacheable(status_code: int, body: bytes) -> bool:
+    """
+    Éxitos (2xx) y errores de validación. Las rutas de citas responden 200
+    con `{"error": ...}` cuando el horario no está disponible: eso también
+    puede cambiar al reintentar, así que no se guarda.
+    """
+    if status_code in CACHEABLE_CLIENT_ERRORS:
+        return True
+    if not 200 <= status_code < 300:
+        return False
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return True
+    return not (isinstance(payload, dict) and "error" in payload)
+
+
+# Instancia compartida por el proceso
+idempotency_store = IdempotencyStore()
+
+
+def _client_scope(request: Request) -> str:
+    """Identifica al usuario del token para que las claves no se crucen entre usuarios."""
+    user_id = get_user_id_from_cookie(request)
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else '-'}"
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """Reproduce la primera respuesta para peticiones repetidas con la misma clave."""
+
+    async def dispatch(self, request: Request, call_next):
+        key_header = request.headers.get(IDEMPOTENCY_HEADER)
+        if (
+            request.method != "POST"
+            or not key_header
+            or not request.url.path.startswith(IDEMPOTENT_PATHS)
+        ):
+            return await call_next(request)
+
+        if len(key_header) > MAX_KEY_LENGTH:
+            return JSONResponse(status_code=400, content={"detail": "Idempotency-Key demasiado larga"})
+
+        key = f"{_client_scope(request)}:{request.url.path}:{key_header}"
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+        while True:
+            entry, owner = idempotency_store.begin(key, fingerprint)
+            if entry.fingerprint != fingerprint:
+                return JSONResponse(
+                    status_code=422,
+                    content={"detail": "La Idempotency-Key ya se usó con otro contenido"}
+                )
+            if owner:
+                break
+
+            try:
+                await asyncio.wait_for(entry.done.wait(), timeout=WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "La solicitud original sigue en proceso"}
+                )
+            if entry.response is not None:
+                status_code, media_type, body = entry.response
+                return Response(
+                    content=body,
+                    status_code=status_code,
+                    media_type=media_type,
+                    headers={"Idempotent-Replayed": "true"}
+                )
+            # La ejecución original falló: se vuelve a intentar
+
+        try:
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        except Exception:
+            idempotency_store.abort(key)
+            raise
+
+        if _cacheable(response.status_code, body):
+            idempotency_store.complete(
+                key,
+                response.status_code,
+                response.headers.get("content-type", "application/json"),
+                body
+            )
+        else:
+            idempotency_store.abort(key)
+
+        rebuilt = Response(content=body, status_code=response.status_code)
+        rebuilt.raw_headers = list(response.raw_headers)  # conserva cada Set-Cookie repetido
+        return rebuilt
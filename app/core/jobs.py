@@ -0,0 +1,331 @@
+# =========================================================
+# 📁 app/core/jobs.py — Tareas en segundo plano para el admin
+# =========================================================
+"""
+Las operaciones pesadas del admin (generar horarios en bloque, exportar el
+histórico, archivar, reconstruir estadísticas) se ejecutan fuera del proceso
+web, en un pool local de procesos.
+
+La ruta crea una fila en `jobs` y devuelve su id al momento. El proceso
+hijo abre su propia sesión, va guardando el progreso en la fila y comprueba
+en cada aviso de progreso si se pidió cancelar. Como el estado vive en la
+base de datos, cualquier worker web puede consultarlo o cancelarlo.
+"""
+import csv
+import logging
+import multiprocessing
+import os
+import socket
+import time as time_module
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, NamedTuple, Optional
+
+from decouple import config
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Job, Appointment, AvailableSlot, Reason, Resource, User, DEFAULT_RESOURCE_ID
+from app.core.archive import appointment_history, archive_past_appointments, prune_expired_slots
+from app.core.availability_index import availability_index
+from app.core.stats import record_capacity, rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = config("JOB_WORKERS", default=2, cast=int)
+EXPORT_DIR = config("JOB_EXPORT_DIR", default="exports")
+PROGRESS_INTERVAL = 1.0   # segundos mínimos entre escrituras de progreso
+EXPORT_BATCH = 1000
+MAX_ERROR_LENGTH = 1000
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de la tarea cuando el admin pidió cancelarla."""
+
+
+class JobContext:
+    """Canal de la tarea hacia su fila: progreso y comprobación de cancelación."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._db = SessionLocal()  # sesión propia: no mezcla commits con los de la tarea
+        self._last_write = 0.0
+
+    def progress(self, done: int, total: int, force: bool = False):
+        now = time_module.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+
+        percent = min(99, int(done * 100 / total)) if total else 0
+        job = self._db.get(Job, self.job_id)
+        job.progress = percent
+        self._db.commit()
+        self._db.refresh(job)
+        if job.cancel_requested:
+            raise JobCancelled()
+
+    def close(self):
+        self._db.close()
+
+
+# =========================================================
+# 🧰 TAREAS DISPONIBLES
+# =========================================================
+def _parse_date(value, default: Optional[date] = None) -> date:
+    if value is None:
+        if default is None:
+            raise ValueError("Falta una fecha obligatoria")
+        return default
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def generate_slots(db: Session, ctx: JobContext, params: dict) -> dict:
+    """
+    Crea horarios para cada día de [start, end] en los días de la semana y horas
+    indicados. Los que ya existen se respetan (ON CONFLICT DO NOTHING).
+    """
+    start = _parse_date(params.get("start"))
+    end = _parse_date(params.get("end"))
+    times = [datetime.strptime(t, "%H:%M").time() for t in params.get("times", [])]
+    weekdays = set(params.get("weekdays", [0, 1, 2, 3, 4]))  # lunes a viernes
+    capacity = int(params.get("capacity", 1))
+    resource_id = int(params.get("resource_id", DEFAULT_RESOURCE_ID))
+
+    if end < start or not times or capacity < 1:
+        raise ValueError("Parámetros inválidos: revisa fechas, horas y capacidad")
+    if not db.get(Resource, resource_id):
+        raise ValueError("Recurso no encontrado")
+
+    total_days = (end - start).days + 1
+    created = 0
+    for offset in range(total_days):
+        day = start + timedelta(days=offset)
+        if day.weekday() in weekdays:
+            rows = [
+                {"resource_id": resource_id, "date": day, "time": t, "capacity": capacity}
+                for t in times
+            ]
+            inserted = db.execute(
+                insert(AvailableSlot).values(rows)
+                .on_conflict_do_nothing(constraint="uq_available_slots_resource_date_time")
+                .returning(AvailableSlot.id)
+            ).fetchall()
+            if inserted:
+                record_capacity(db, day, capacity * len(inserted), len(inserted))
+            db.commit()  # un día por transacción: lo ya creado se conserva si se cancela
+            created += len(inserted)
+        ctx.progress(offset + 1, total_days)
+
+    return {"created": created, "days": total_days}
+
+
+def export_appointments(db: Session, ctx: JobContext, params: dict) -> dict:
+    """Exporta a CSV las citas del rango (opcionalmente con las archivadas)."""
+    source = appointment_history() if params.get("include_archived") else Appointment.__table__
+    query = (
+        db.query(
+            source.c.id, source.c.date, source.c.time, source.c.end_time,
+            User.full_name, User.email, Reason.name, Resource.name
+        )
+        .join(User, User.id == source.c.user_id)
+        .outerjoin(Reason, Reason.id == source.c.reason_id)
+        .outerjoin(Resource, Resource.id == source.c.resource_id)
+    )
+    if params.get("start"):
+        query = query.filter(source.c.date >= _parse_date(params["start"]))
+    if params.get("end"):
+        query = query.filter(source.c.date <= _parse_date(params["end"]))
+
+    total = query.order_by(None).count()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"job-{ctx.job_id}.csv")
+
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "fecha", "hora", "fin", "usuario", "email", "motivo", "recurso"])
+        for row in query.order_by(source.c.date, source.c.time).yield_per(EXPORT_BATCH):
+            writer.writerow([
+                row[0], row[1].isoformat(), row[2].strftime("%H:%M"),
+                row[3].strftime("%H:%M") if row[3] else "",
+                row[4], row[5], row[6] or "Sin motivo", row[7] or ""
+            ])
+            written += 1
+            if written % EXPORT_BATCH == 0:
+                ctx.progress(written, total)
+
+    return {"rows": written, "file": path}
+
+
+def archive_history(db: Session, ctx: JobContext, params: dict) -> dict:
+    """Archiva citas pasadas y elimina horarios vencidos (ver app/core/archive.py)."""
+    before = _parse_date(params.get("before"), date.today())
+    archived = archive_past_appointments(db, before)
+    ctx.progress(1, 2, force=True)
+    pruned = prune_expired_slots(db, before)
+    return {"archived": archived, "pruned": pruned, "before": before.isoformat()}
+
+
+def rebuild_statistics(db: Session, ctx: JobContext, params: dict) -> dict:
+    return {"mismatches": rebuild_stats(db)}
+
+
+class JobKind(NamedTuple):
+    run: Callable[[Session, JobContext, dict], dict]
+    reload_index: bool  # si cambia horarios vigentes, el proceso web recarga su índice
+
+
+JOB_KINDS: Dict[str, JobKind] = {
+    "generate_slots": JobKind(run=generate_slots, reload_index=True),
+    "export_appointments": JobKind(run=export_appointments, reload_index=False),
+    "archive": JobKind(run=archive_history, reload_index=False),
+    "rebuild_stats": JobKind(run=rebuild_statistics, reload_index=False),
+}
+
+
+# =========================================================
+# 🏃 EJECUCIÓN EN EL PROCESO HIJO
+# =========================================================
+def _finish(db: Session, job: Job, status: str, **fields):
+    job.status = status
+    job.finished_at = datetime.utcnow()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    db.commit()
+
+
+def _run_job(job_id: int):
+    """Punto de entrada del proceso hijo; todo el estado se guarda en la fila."""
+    db = SessionLocal()
+    ctx = JobContext(job_id)
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            return
+        if job.cancel_requested:
+            _finish(db, job, "cancelled")
+            return
+
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.commit()
+
+        try:
+            result = JOB_KINDS[job.kind].run(db, ctx, dict(job.params or {}))
+        except JobCancelled:
+            db.rollback()
+            _finish(db, db.get(Job, job_id), "cancelled")
+        except Exception as exc:
+            db.rollback()
+            logger.exception("La tarea %s (%s) falló", job_id, job.kind)
+            _finish(db, db.get(Job, job_id), "failed", error=str(exc)[:MAX_ERROR_LENGTH])
+        else:
+            _finish(db, db.get(Job, job_id), "done", progress=100, result=result)
+    finally:
+        ctx.close()
+        db.close()
+
+
+# =========================================================
+# 🎛️ PLANIFICADOR EN EL PROCESO WEB
+# =========================================================
+def _owner_tag() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRunner:
+    """Pool de procesos local y registro de las tareas lanzadas desde este proceso."""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._futures: Dict[int, Future] = {}
+
+    def start(self):
+        # "spawn": el hijo no hereda el pool de conexiones ni el event loop del padre
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, db: Session, kind: str, params: dict, user_id: Optional[int]) -> Job:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Tipo de tarea desconocido: {kind}")
+        if self._executor is None:
+            raise RuntimeError("El planificador de tareas no está iniciado")
+
+        job = Job(kind=kind, params=params, status="queued", owner=_owner_tag(), created_by=user_id)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        future = self._executor.submit(_run_job, job.id)
+        self._futures[job.id] = future
+        future.add_done_callback(partial(self._on_done, job.id, kind))
+        return job
+
+    def cancel(self, db: Session, job: Job) -> Job:
+        """Pide cancelar; si aún no empezó y está en este proceso, se descarta ya."""
+        job.cancel_requested = True
+        future = self._futures.get(job.id)
+        if job.status == "queued" and future is not None and future.cancel():
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def recover(self, db: Session):
+        """Marca como fallidas las tareas activas cuyo proceso web de este host ya no existe."""
+        host = socket.gethostname()
+        jobs = db.query(Job).filter(Job.status.in_(ACTIVE_STATUSES)).all()
+        for job in jobs:
+            owner_host, _, pid = (job.owner or "").rpartition(":")
+            if owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                job.status = "failed"
+                job.error = "Interrumpida por un reinicio del servidor"
+                job.finished_at = datetime.utcnow()
+        db.commit()
+
+    def _on_done(self, job_id: int, kind: str, future: Future):
+        self._futures.pop(job_id, None)
+        if future.cancelled():
+            return
+
+        db = SessionLocal()
+        try:
+            exc = future.exception()
+            if exc is not None:
+                # El hijo murió sin poder escribir su estado (p. ej. BrokenProcessPool)
+                job = db.get(Job, job_id)
+                if job is not None and job.status in ACTIVE_STATUSES:
+                    _finish(db, job, "failed", error=str(exc)[:MAX_ERROR_LENGTH] or type(exc).__name__)
+            elif JOB_KINDS[kind].reload_index:
+                availability_index.refresh_if_changed(db)  # solo los días que tocó la tarea
+        except Exception:
+            logger.exception("Error al cerrar la tarea %s", job_id)
+        finally:
+            db.close()
+
+
+# Instancia compartida por el proceso web
+job_runner = JobRunner()
@@ -0,0 +1,291 @@
+# =========================================================
+# 📁 app/core/profiling.py — Perfilado bajo demanda de peticiones
+# =========================================================
+"""
+Perfil estadístico de una petición concreta en producción, sin coste para
+el resto del tráfico.
+
+Se activa de tres formas:
+- `?_profile=1` con la cookie de un administrador;
+- el encabezado `X-Profile-Token` con un token firmado y de corta duración
+  que emite `POST /admin/profiles/token` (útil con curl o desde un proxy);
+- por muestreo aleatorio (`PROFILE_SAMPLE_RATE`, 0 por defecto).
+
+Mientras dura la petición, un hilo muestrea cada pocos milisegundos las
+pilas de los hilos que están ejecutando código de `app/` y las acumula en
+formato "folded" (apto para flamegraph.pl / speedscope). En paralelo se
+anota la cronología de consultas SQL mediante eventos del engine. Con
+peticiones concurrentes el perfil puede incluir muestras de otras rutas;
+es una vista estadística, no una traza exacta.
+
+Cada perfil se guarda como JSON en un anillo acotado en disco
+(`PROFILE_DIR`, máximo `PROFILE_MAX_FILES` archivos).
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+from decouple import config
+from fastapi import Request
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.auth import SECRET_KEY, get_user_id_from_cookie
+from app.database import engine, SessionLocal
+from app.models import User
+
+PROFILE_DIR = config("PROFILE_DIR", default="profiles")
+PROFILE_MAX_FILES = config("PROFILE_MAX_FILES", default=50, cast=int)
+PROFILE_SAMPLE_RATE = config("PROFILE_SAMPLE_RATE", default=0.0, cast=float)
+SAMPLE_INTERVAL = config("PROFILE_INTERVAL_MS", default=5, cast=int) / 1000
+TOKEN_TTL_SECONDS = 15 * 60
+MAX_SQL_LENGTH = 500
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_QUERY_FLAG = "_profile"
+EXCLUDED_PREFIXES = ("/static/", "/appointments/stream", "/admin/profiles")
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{6}$")
+
+# Clave distinta de la de los JWT: un token de perfilado no sirve para iniciar sesión
+_PROFILE_KEY = hashlib.sha256(f"{SECRET_KEY}:profiling".encode()).digest()
+
+
+# =========================================================
+# 🔑 TOKENS FIRMADOS
+# =========================================================
+def _sign(payload: str) -> str:
+    return hmac.new(_PROFILE_KEY, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def profile_token(user_id: int, ttl_seconds: int = TOKEN_TTL_SECONDS) -> str:
+    payload = f"{user_id}.{int(time.time()) + ttl_seconds}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def valid_profile_token(token: str) -> bool:
+    payload, _, signature = token.rpartition(".")
+    _, _, expires = payload.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(_sign(payload), signature)
+
+
+# =========================================================
+# 🔬 MUESTREO DE PILAS Y CRONOLOGÍA SQL
+# =========================================================
+class _StackSampler:
+    """Hilo que cuenta las pilas de los hilos que ejecutan código de la app."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common())
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(APP_DIR)
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if in_app:
+                    self._stacks[";".join(reversed(stack))] += 1
+
+
+class _ActiveProfile:
+    __slots__ = ("started", "queries")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries: List[dict] = []
+
+
+_active: ContextVar[Optional[_ActiveProfile]] = ContextVar("active_profile", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    if profile is None or not conn.info.get("profile_started"):
+        return
+    started = conn.info["profile_started"].pop()
+    profile.queries.append({
+        "start_ms": round((started - profile.started) * 1000, 3),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "statement": statement[:MAX_SQL_LENGTH]
+    })
+
+
+# =========================================================
+# 💾 ANILLO EN DISCO
+# =========================================================
+class ProfileStore:
+    """Guarda los últimos `max_files` perfiles; al superar el límite borra los más antiguos."""
+
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        ids = [name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted(ids, key=lambda i: int(i.split("-")[0]), reverse=True)
+
+    def save(self, record: dict):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(record["id"]), "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            for old_id in self._ids()[self.max_files:]:
+                try:
+                    os.remove(self._path(old_id))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[dict]:
+        """Metadatos de los perfiles guardados (sin pilas ni SQL), del más reciente al más antiguo."""
+        summaries = []
+        for profile_id in self._ids():
+            try:
+                with open(self._path(profile_id), encoding="utf-8") as f:
+                    record = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            record.pop("stacks", None)
+            record["queries"] = len(record.get("queries", []))
+            summaries.append(record)
+        return summaries
+
+    def path_for(self, profile_id: str) -> Optional[str]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id)
+        return path if os.path.isfile(path) else None
+
+
+# Instancia compartida por el proceso
+profile_store = ProfileStore()
+
+
+# =========================================================
+# 🧪 MIDDLEWARE
+# =========================================================
+def _is_admin(user_id: Optional[str]) -> bool:
+    if not user_id:
+        return False
+    db = SessionLocal()
+    try:
+        return bool(db.query(User.is_admin).filter(User.id == int(user_id)).scalar())
+    finally:
+        db.close()
+
+
+def _route_name(request: Request) -> Optional[str]:
+    """Nombre tipo `users.index` / `admin.list_appointments` de la ruta resuelta."""
+    route = request.scope.get("route")
+    endpoint = request.scope.get("endpoint")
+    if route is None or endpoint is None:
+        return None
+    return f"{endpoint.__module__.rsplit('.', 1)[-1]}.{getattr(route, 'name', endpoint.__name__)}"
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """Perfila las peticiones marcadas por un admin o elegidas por muestreo."""
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, store: ProfileStore = None):
+        super().__init__(app)
+        self.sample_rate = sample_rate
+        self.store = store or profile_store
+
+    async def _trigger(self, request: Request) -> Optional[str]:
+        token = request.headers.get(PROFILE_HEADER)
+        if token and valid_profile_token(token):
+            return "token"
+        if request.query_params.get(PROFILE_QUERY_FLAG) == "1":
+            user_id = get_user_id_from_cookie(request)
+            if await run_in_threadpool(_is_admin, user_id):
+                return "admin"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path.startswith(EXCLUDED_PREFIXES):
+            return await call_next(request)
+
+        trigger = await self._trigger(request)
+        if trigger is None:
+            return await call_next(request)
+
+        profile = _ActiveProfile()
+        sampler = _StackSampler()
+        context_token = _active.set(profile)
+        sampler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            stacks = sampler.stop()
+            _active.reset(context_token)
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+
+        profile_id = f"{int(time.time() * 1000)}-{secrets.token_hex(3)}"
+        record = {
+            "id": profile_id,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "trigger": trigger,
+            "method": request.method,
+            "path": request.url.path,
+            "route": _route_name(request),
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 3),
+            "samples": sampler.samples,
+            "sample_interval_ms": sampler.interval * 1000,
+            "sql_count": len(profile.queries),
+            "sql_ms": round(sum(q["duration_ms"] for q in profile.queries), 3),
+            "queries": profile.queries,
+            "stacks": stacks
+        }
+        await run_in_threadpool(self.store.save, record)
+        response.headers["X-Profile-Id"] = profile_id
+        return response
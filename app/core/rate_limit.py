@@ -0,0 +1,178 @@
+# =========================================================
+# 📁 app/core/rate_limit.py — Límite de peticiones y control de admisión
+# =========================================================
+"""
+Protección de las rutas más costosas (login con bcrypt, registro y creación
+de citas) frente a ráfagas de bots.
+
+- Token bucket por IP y por usuario. El backend en memoria sirve para un solo
+  proceso; con varios workers se usa el backend Redis (`RATE_LIMIT_BACKEND=redis`
+  y `REDIS_URL`), que comparte los contadores entre procesos.
+- Límite global de peticiones simultáneas por ruta: lo que excede el límite se
+  rechaza al momento con 429 y `Retry-After` en vez de hacer cola.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from decouple import config
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.auth import get_user_id_from_cookie
+
+
+class RateRule(NamedTuple):
+    rate: float      # tokens repuestos por segundo
+    burst: int       # tamaño máximo del bucket
+
+
+class EndpointLimits(NamedTuple):
+    per_ip: RateRule
+    per_user: Optional[RateRule]
+    max_concurrent: int
+
+
+# (método, ruta) -> límites
+ENDPOINT_LIMITS: Dict[Tuple[str, str], EndpointLimits] = {
+    ("POST", "/users/login"): EndpointLimits(
+        per_ip=RateRule(rate=10 / 60, burst=10), per_user=None, max_concurrent=8
+    ),
+    ("POST", "/users/register"): EndpointLimits(
+        per_ip=RateRule(rate=5 / 3600, burst=5), per_user=None, max_concurrent=4
+    ),
+    ("POST", "/appointments/create"): EndpointLimits(
+        per_ip=RateRule(rate=30 / 60, burst=30),
+        per_user=RateRule(rate=10 / 60, burst=10),
+        max_concurrent=32
+    ),
+}
+
+
+# =========================================================
+# 🪣 BACKENDS DE TOKEN BUCKET
+# =========================================================
+class MemoryBackend:
+    """Token bucket en memoria del proceso, con número de claves acotado."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # clave -> [tokens, último instante]
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rule: RateRule) -> float:
+        """Consume un token. Devuelve 0 si se permite o los segundos a esperar."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(rule.burst), now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(rule.burst, bucket[0] + (now - bucket[1]) * rule.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rule.rate
+
+
+_REDIS_TOKEN_BUCKET = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[2])
+local last = tonumber(redis.call('HGET', KEYS[1], 'ts') or ARGV[3])
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """
+    Token bucket compartido entre workers mediante un script Lua atómico.
+    Usa el cliente asíncrono: la ida y vuelta a Redis no bloquea el event loop.
+    """
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requiere instalar el paquete 'redis' (>= 4.2)")
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def take(self, key: str, rule: RateRule) -> float:
+        wait = await self._script(keys=[f"ratelimit:{key}"], args=[rule.rate, rule.burst, time.time()])
+        return float(wait)
+
+
+def build_backend():
+    backend = config("RATE_LIMIT_BACKEND", default="memory")
+    if backend == "redis":
+        return RedisBackend(config("REDIS_URL", default="redis://localhost:6379/0"))
+    return MemoryBackend()
+
+
+# =========================================================
+# 🚦 MIDDLEWARE
+# =========================================================
+def _too_many(retry_after: float, detail: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """Aplica token buckets y límites de concurrencia a las rutas configuradas."""
+
+    def __init__(self, app, backend=None, limits: Dict[Tuple[str, str], EndpointLimits] = None):
+        super().__init__(app)
+        self.backend = backend or build_backend()
+        self.limits = limits if limits is not None else ENDPOINT_LIMITS
+        self._in_flight: Dict[Tuple[str, str], int] = {}
+
+    async def dispatch(self, request: Request, call_next):
+        endpoint = (request.method, request.url.path)
+        limits = self.limits.get(endpoint)
+        if limits is None:
+            return await call_next(request)
+
+        # 1️⃣ Control de admisión: no dejar que se forme cola
+        if self._in_flight.get(endpoint, 0) >= limits.max_concurrent:
+            return _too_many(1, "Servidor ocupado, inténtalo de nuevo en unos segundos")
+
+        # 2️⃣ Token bucket por IP y por usuario
+        path = request.url.path
+        client_ip = request.client.host if request.client else "-"
+        wait = await self.backend.take(f"ip:{client_ip}:{path}", limits.per_ip)
+
+        user_id = get_user_id_from_cookie(request) if limits.per_user else None
+        if not wait and user_id:
+            wait = await self.backend.take(f"user:{user_id}:{path}", limits.per_user)
+
+        if wait:
+            return _too_many(wait, "Demasiadas solicitudes, inténtalo más tarde")
+
+        self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+        try:
+            return await call_next(request)
+        finally:
+            self._in_flight[endpoint] -= 1
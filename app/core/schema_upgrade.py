@@ -0,0 +1,201 @@
+# =========================================================
+# 📁 app/core/schema_upgrade.py — Actualización de bases ya existentes
+# =========================================================
+"""
+`Base.metadata.create_all` solo crea las tablas que faltan: nunca añade
+columnas, índices ni restricciones a una tabla que ya existe. Este módulo
+pone al día una base creada con una versión anterior.
+
+Cada paso comprueba si su columna ya existe; si no, la añade y rellena los
+datos existentes en la misma transacción. Todo corre bajo un advisory lock,
+así que varios workers que arrancan a la vez no lo ejecutan dos veces. Es
+idempotente: se llama al arrancar la app y desde `python -m app.init_db`.
+"""
+import logging
+from typing import Set
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.models import DEFAULT_RESOURCE_ID, DEFAULT_DURATION_MINUTES
+from app.core.slots import MINUTES_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+UPGRADE_LOCK_KEY = 72_019_026  # clave fija del advisory lock de la actualización
+
+
+def _columns(conn: Connection, table: str) -> Set[str]:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _slot_capacity(conn: Connection) -> bool:
+    """Plazas por horario y contador de plazas ocupadas, calculado desde las citas."""
+    if "booked_count" in _columns(conn, "available_slots"):
+        return False
+
+    # Antes no había restricción única: los horarios repetidos se quedan en uno
+    conn.execute(text("""
+        DELETE FROM available_slots s
+        USING available_slots keep
+        WHERE s.date = keep.date AND s.time = keep.time AND s.id > keep.id
+    """))
+    conn.execute(text("""
+        ALTER TABLE available_slots
+            ADD COLUMN IF NOT EXISTS capacity INTEGER NOT NULL DEFAULT 1,
+            ADD COLUMN IF NOT EXISTS booked_count INTEGER NOT NULL DEFAULT 0
+    """))
+    # Las plazas ya ocupadas son las citas existentes de cada horario
+    conn.execute(text("""
+        UPDATE available_slots s
+        SET booked_count = c.n, capacity = GREATEST(s.capacity, c.n)
+        FROM (SELECT date, time, COUNT(*) AS n FROM appointments GROUP BY date, time) c
+        WHERE s.date = c.date AND s.time = c.time
+    """))
+    conn.execute(text("""
+        ALTER TABLE available_slots
+            ADD CONSTRAINT uq_available_slots_date_time UNIQUE (date, time),
+            ADD CONSTRAINT ck_available_slots_booked_count
+                CHECK (booked_count >= 0 AND booked_count <= capacity)
+    """))
+    return True
+
+
+def _resources(conn: Connection) -> bool:
+    """Horarios y citas por recurso: lo existente pasa al recurso "General"."""
+    if "resource_id" in _columns(conn, "available_slots"):
+        return False
+
+    # Mismo criterio que ensure_default_resource: en una tabla vacía recibe el id 1
+    conn.execute(text("""
+        INSERT INTO resources (name, kind, is_active)
+        SELECT 'General', 'practitioner', true
+        WHERE NOT EXISTS (SELECT 1 FROM resources)
+    """))
+    conn.execute(text(f"""
+        ALTER TABLE available_slots
+            ADD COLUMN resource_id INTEGER NOT NULL DEFAULT {DEFAULT_RESOURCE_ID} REFERENCES resources (id),
+            DROP CONSTRAINT IF EXISTS uq_available_slots_date_time,
+            ADD CONSTRAINT uq_available_slots_resource_date_time UNIQUE (resource_id, date, time)
+    """))
+    conn.execute(text(f"""
+        ALTER TABLE appointments
+            ADD COLUMN IF NOT EXISTS resource_id INTEGER NOT NULL DEFAULT {DEFAULT_RESOURCE_ID} REFERENCES resources (id)
+    """))
+    conn.execute(text("""
+        ALTER TABLE appointments_archive
+            ADD COLUMN IF NOT EXISTS resource_id INTEGER REFERENCES resources (id)
+    """))
+    conn.execute(
+        text("UPDATE appointments_archive SET resource_id = :id WHERE resource_id IS NULL"),
+        {"id": DEFAULT_RESOURCE_ID}
+    )
+    conn.execute(text("DROP INDEX IF EXISTS ix_appointments_date_time"))
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_appointments_resource_date_time
+            ON appointments (resource_id, date, time)
+    """))
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_appointments_user_date_time
+            ON appointments (user_id, date, time)
+    """))
+    return True
+
+
+def _durations(conn: Connection) -> bool:
+    """Duración de los motivos y hora de fin de las citas, calculada desde el motivo."""
+    conn.execute(text(f"""
+        ALTER TABLE reasons
+            ADD COLUMN IF NOT EXISTS duration_minutes INTEGER NOT NULL DEFAULT {DEFAULT_DURATION_MINUTES}
+    """))
+    conn.execute(text("ALTER TABLE appointments_archive ADD COLUMN IF NOT EXISTS end_time TIME"))
+    if "end_time" in _columns(conn, "appointments"):
+        return False
+
+    conn.execute(text("ALTER TABLE appointments ADD COLUMN end_time TIME"))
+    # Inicio + duración del motivo, sin pasar de medianoche (como appointment_end)
+    conn.execute(text("""
+        UPDATE appointments a
+        SET end_time = CASE
+            WHEN EXTRACT(EPOCH FROM a.time) / 60 + d.minutes >= :day_minutes THEN TIME '23:59'
+            ELSE a.time + make_interval(mins => d.minutes)
+        END
+        FROM (
+            SELECT a2.id, COALESCE(r.duration_minutes, :default) AS minutes
+            FROM appointments a2 LEFT JOIN reasons r ON r.id = a2.reason_id
+        ) d
+        WHERE d.id = a.id
+    """), {"day_minutes": MINUTES_PER_DAY, "default": DEFAULT_DURATION_MINUTES})
+    conn.execute(text("ALTER TABLE appointments ALTER COLUMN end_time SET NOT NULL"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_appointments_resource_date_time"))
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_appointments_resource_date_span
+            ON appointments (resource_id, date, time, end_time)
+    """))
+    return True
+
+
+def _refresh_rotation(conn: Connection) -> bool:
+    """Marca de rotación de los refresh tokens (el margen de gracia solo aplica a rotados)."""
+    if "rotated_at" in _columns(conn, "refresh_tokens"):
+        return False
+    # Los tokens ya anulados quedan sin marca: no reciben margen de gracia
+    conn.execute(text("ALTER TABLE refresh_tokens ADD COLUMN rotated_at TIMESTAMP"))
+    return True
+
+
+def _availability_versions(conn: Connection) -> bool:
+    """Trigger que sube la versión de (recurso, día) cuando cambian sus horarios."""
+    exists = conn.execute(text(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'trg_available_slots_version'"
+    )).first()
+    if exists:
+        return False
+
+    # Una subida por transacción y día (txid): quien escribe sabe que su cambio
+    # es la versión siguiente. También cubre tareas y cambios directos en la base.
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION bump_availability_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO availability_versions AS v (resource_id, date, version, txid)
+                VALUES (OLD.resource_id, OLD.date, 1, txid_current())
+                ON CONFLICT (resource_id, date) DO UPDATE
+                    SET version = v.version + 1, txid = EXCLUDED.txid
+                    WHERE v.txid IS DISTINCT FROM EXCLUDED.txid;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO availability_versions AS v (resource_id, date, version, txid)
+                VALUES (NEW.resource_id, NEW.date, 1, txid_current())
+                ON CONFLICT (resource_id, date) DO UPDATE
+                    SET version = v.version + 1, txid = EXCLUDED.txid
+                    WHERE v.txid IS DISTINCT FROM EXCLUDED.txid;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER trg_available_slots_version
+            AFTER INSERT OR UPDATE OR DELETE ON available_slots
+            FOR EACH ROW EXECUTE FUNCTION bump_availability_version()
+    """))
+    return True
+
+
+UPGRADE_STEPS = [
+    _slot_capacity,
+    _resources,
+    _durations,
+    _refresh_rotation,
+    _availability_versions,
+]
+
+
+def upgrade_schema(engine: Engine):
+    """Aplica los pasos pendientes en una sola transacción."""
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": UPGRADE_LOCK_KEY})
+        for step in UPGRADE_STEPS:
+            if step(conn):
+                logger.info("Esquema actualizado: %s", step.__doc__)
@@ -0,0 +1,71 @@
+# =========================================================
+# 📁 app/core/session_refresh.py — Renovación transparente de la sesión
+# =========================================================
+"""
+Si el access token de la cookie falta o caducó pero hay un refresh token,
+se canjea (una búsqueda indexada, sin bcrypt), se inyecta el access token
+nuevo en la petición en curso y se devuelven las cookies renovadas con la
+respuesta. Así un usuario activo nunca vuelve a pasar por `/users/login`.
+"""
+from typing import Optional, Tuple
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.auth import (
+    create_access_token,
+    decode_access_token,
+    rotate_refresh_token,
+    set_session_cookies
+)
+from app.database import SessionLocal
+
+SKIP_PATHS = ("/static/", "/users/login", "/users/logout", "/users/refresh")
+
+
+def _replace_cookie(request: Request, name: str, value: str):
+    """Reescribe la cabecera Cookie para que las rutas vean el token nuevo."""
+    cookies = dict(request.cookies)
+    cookies[name] = value
+    header = "; ".join(f"{k}={v}" for k, v in cookies.items()).encode("latin-1")
+    headers = [(k, v) for k, v in request.scope["headers"] if k != b"cookie"]
+    headers.append((b"cookie", header))
+    request.scope["headers"] = headers
+
+
+def _rotate(refresh_token: str) -> Optional[Tuple[int, Optional[str]]]:
+    db = SessionLocal()
+    try:
+        return rotate_refresh_token(db, refresh_token)
+    finally:
+        db.close()
+
+
+class SessionRefreshMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        refresh_token = request.cookies.get("refresh_token")
+        access_token = request.cookies.get("access_token")
+
+        if (
+            not refresh_token
+            or request.url.path.startswith(SKIP_PATHS)
+            or (access_token and decode_access_token(access_token))
+        ):
+            return await call_next(request)
+
+        # SELECT ... FOR UPDATE y commit: fuera del event loop para no frenar el SSE
+        result = await run_in_threadpool(_rotate, refresh_token)
+
+        if result is None:
+            response = await call_next(request)
+            response.delete_cookie("refresh_token")
+            return response
+
+        user_id, new_refresh_token = result
+        new_access_token = create_access_token(data={"sub": str(user_id)})
+        _replace_cookie(request, "access_token", new_access_token)
+
+        response = await call_next(request)
+        set_session_cookies(response, new_access_token, new_refresh_token)
+        return response
@@ -0,0 +1,133 @@
+# =========================================================
+# 📁 app/core/slots.py — Ocupación de horarios con contador atómico
+# =========================================================
+from datetime import date, time
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import Appointment, AvailableSlot, Reason, Resource, DEFAULT_DURATION_MINUTES
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def ensure_default_resource(db: Session):
+    """
+    Crea el recurso "General" en una base vacía; al ser el primero recibe el
+    id DEFAULT_RESOURCE_ID de la secuencia (sin fijar el id a mano).
+    """
+    if db.query(Resource.id).first() is None:
+        db.add(Resource(name="General"))
+        db.commit()
+
+
+def reserve_seat(db: Session, resource_id: int, date_obj: date, time_obj: time) -> bool:
+    """
+    Ocupa una plaza del horario con un UPDATE condicional.
+
+    La condición `booked_count < capacity` la evalúa la propia base de datos,
+    así que dos reservas simultáneas nunca pueden superar la capacidad.
+    Cada recurso tiene sus propias filas, así que reservas de profesionales
+    distintos nunca compiten por la misma fila.
+    Devuelve False si el horario no existe o está completo. No hace commit:
+    el llamador confirma la reserva junto con la cita en la misma transacción.
+    """
+    updated = (
+        db.query(AvailableSlot)
+        .filter(
+            AvailableSlot.resource_id == resource_id,
+            AvailableSlot.date == date_obj,
+            AvailableSlot.time == time_obj,
+            AvailableSlot.booked_count < AvailableSlot.capacity
+        )
+        .update(
+            {AvailableSlot.booked_count: AvailableSlot.booked_count + 1},
+            synchronize_session=False
+        )
+    )
+    return updated == 1
+
+
+def release_seat(db: Session, resource_id: int, date_obj: date, time_obj: time) -> bool:
+    """Libera una plaza del horario (sin bajar de cero). No hace commit."""
+    updated = (
+        db.query(AvailableSlot)
+        .filter(
+            AvailableSlot.resource_id == resource_id,
+            AvailableSlot.date == date_obj,
+            AvailableSlot.time == time_obj,
+            AvailableSlot.booked_count > 0
+        )
+        .update(
+            {AvailableSlot.booked_count: AvailableSlot.booked_count - 1},
+            synchronize_session=False
+        )
+    )
+    return updated == 1
+
+
+# =========================================================
+# ⏱️ DURACIÓN Y SOLAPES
+# =========================================================
+def find_reason(db: Session, value: str) -> Optional[Reason]:
+    """
+    Busca un motivo por id o por nombre. Solo se compara con el id si el valor
+    es numérico: comparar un nombre con la columna entera falla en Postgres.
+    """
+    condition = Reason.name == value
+    if value.isdigit():
+        condition = (Reason.id == int(value)) | condition
+    return db.query(Reason).filter(condition).order_by(Reason.id).first()
+
+
+def reason_duration(reason: Optional[Reason]) -> int:
+    """Minutos que dura una cita con ese motivo (o la duración por defecto)."""
+    return reason.duration_minutes if reason and reason.duration_minutes else DEFAULT_DURATION_MINUTES
+
+
+def appointment_end(start: time, duration_minutes: int) -> time:
+    """Hora de fin (exclusiva). ValueError si la cita pasaría de medianoche."""
+    end = start.hour * 60 + start.minute + duration_minutes
+    if duration_minutes < 1 or end >= MINUTES_PER_DAY:
+        raise ValueError("La cita debe terminar el mismo día")
+    return time(end // 60, end % 60)
+
+
+def appointment_minutes(start: time, end: Optional[time]) -> int:
+    """Duración en minutos de una cita guardada (por defecto si no tiene fin)."""
+    if end is None:
+        return DEFAULT_DURATION_MINUTES
+    return (end.hour * 60 + end.minute) - (start.hour * 60 + start.minute)
+
+
+def lock_resource_days(db: Session, keys: Iterable[Tuple[int, date]]):
+    """
+    Serializa las reservas de los (recurso, día) indicados hasta el fin de la
+    transacción con advisory locks de Postgres. Se bloquean siempre en el
+    mismo orden para que dos reprogramaciones cruzadas no se interbloqueen.
+    """
+    for resource_id, day in sorted(set(keys)):
+        db.execute(select(func.pg_advisory_xact_lock(resource_id, day.toordinal())))
+
+
+def has_overlap(db: Session, resource_id: int, day: date, start: time, end: time,
+                exclude_id: Optional[int] = None) -> bool:
+    """
+    Indica si [start, end) se solapa con otra cita del recurso ese día.
+
+    Las citas que empiezan exactamente a la misma hora no cuentan: comparten
+    horario y de eso se encarga el contador de plazas. Hay que llamarla con
+    `lock_resource_days` tomado para que la comprobación y el INSERT sean
+    atómicos frente a otras reservas del mismo recurso y día.
+    """
+    query = db.query(Appointment.id).filter(
+        Appointment.resource_id == resource_id,
+        Appointment.date == day,
+        Appointment.time < end,
+        Appointment.end_time > start,
+        Appointment.time != start
+    )
+    if exclude_id is not None:
+        query = query.filter(Appointment.id != exclude_id)
+    return db.query(query.exists()).scalar()
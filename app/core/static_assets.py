@@ -0,0 +1,131 @@
+# =========================================================
+# 📁 app/core/static_assets.py — Estáticos con huella y precomprimidos
+# =========================================================
+"""
+Sirve `/static` con URLs que llevan el hash del contenido
+(`styles.3f2a9c1b7d4e.css`) y cabeceras de caché `immutable` de un año.
+
+Al arrancar se lee cada archivo una sola vez, se calcula su huella y se
+generan las variantes gzip (y brotli si el paquete está instalado). Las
+plantillas obtienen la URL con `{{ static_url('styles.css') }}`. Las URLs sin
+huella siguen funcionando, pero con revalidación por ETag.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+try:
+    import brotli  # opcional
+except ImportError:
+    brotli = None
+
+HASH_LENGTH = 12
+MIN_COMPRESS_SIZE = 512
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class _Asset:
+    __slots__ = ("media_type", "etag", "variants")
+
+    def __init__(self, media_type: str, etag: str, variants: Dict[str, bytes]):
+        self.media_type = media_type
+        self.etag = etag
+        self.variants = variants  # codificación ("identity", "gzip", "br") -> bytes
+
+
+class StaticAssets:
+    """Aplicación ASGI para `/static` con huellas de contenido y precompresión."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets: Dict[str, _Asset] = {}        # ruta lógica -> asset
+        self._fingerprinted: Dict[str, str] = {}    # ruta con huella -> ruta lógica
+        self._urls: Dict[str, str] = {}             # ruta lógica -> ruta con huella
+        self._load()
+
+    def _load(self):
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                name = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    content = f.read()
+
+                digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+                base, ext = os.path.splitext(name)
+                hashed_name = f"{base}.{digest}{ext}"
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+                variants = {"identity": content}
+                if len(content) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+                    variants["gzip"] = gzip.compress(content, compresslevel=9)
+                    if brotli is not None:
+                        variants["br"] = brotli.compress(content)
+
+                self._assets[name] = _Asset(media_type, f'"{digest}"', variants)
+                self._fingerprinted[hashed_name] = name
+                self._urls[name] = hashed_name
+
+    def url_for(self, name: str) -> str:
+        """URL pública con huella; si el archivo no existe se deja sin huella."""
+        return f"/static/{self._urls.get(name, name)}"
+
+    def _pick_encoding(self, asset: _Asset, accept_encoding: str) -> Optional[str]:
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and encoding in accept_encoding:
+                return encoding
+        return None
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if request.method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+            await response(scope, receive, send)
+            return
+
+        # `Mount("/static", ...)` deja la ruta relativa en path_params["path"]
+        path = request.path_params.get("path", "").lstrip("/")
+
+        name = self._fingerprinted.get(path)
+        immutable = name is not None
+        name = name or path
+        asset = self._assets.get(name)
+        if asset is None:
+            await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+            return
+
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+            "ETag": asset.etag,
+            "Vary": "Accept-Encoding",
+        }
+
+        if request.headers.get("if-none-match") == asset.etag:
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+
+        encoding = self._pick_encoding(asset, request.headers.get("accept-encoding", ""))
+        body = asset.variants[encoding or "identity"]
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        response = Response(
+            content=b"" if request.method == "HEAD" else body,
+            media_type=asset.media_type,
+            headers=headers
+        )
+        if request.method == "HEAD":
+            response.headers["Content-Length"] = str(len(body))
+        await response(scope, receive, send)
+
+
+# Instancia compartida por el proceso (se construye al importar, una sola vez)
+static_assets = StaticAssets(directory="static")
+static_url = static_assets.url_for
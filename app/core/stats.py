@@ -0,0 +1,116 @@
+# =========================================================
+# 📁 app/core/stats.py — Estadísticas diarias de ocupación
+# =========================================================
+"""
+Resumen por día (plazas ofrecidas) y por día y motivo (citas reservadas).
+
+Las rutas de escritura llaman a `record_booking` / `record_capacity` dentro
+de su propia transacción; cada llamada es un único UPSERT que suma el delta,
+así que no hace falta leer antes de escribir. `rebuild_stats` recalcula todo
+desde cero (citas vigentes y archivadas + horarios) para verificar.
+"""
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import AvailableSlot, DailyCapacity, DailyReasonCount
+from app.core.archive import appointment_history
+
+NO_REASON = 0
+
+
+def record_booking(db: Session, day: date, reason_id: Optional[int], delta: int = 1):
+    """Suma `delta` citas al día y motivo indicados. No hace commit."""
+    stmt = insert(DailyReasonCount).values(
+        date=day, reason_id=reason_id or NO_REASON, booked=delta
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DailyReasonCount.date, DailyReasonCount.reason_id],
+        set_={"booked": DailyReasonCount.booked + stmt.excluded.booked}
+    ))
+
+
+def record_bookings(db: Session, deltas: Dict[Tuple[date, Optional[int]], int]):
+    """Como `record_booking` para varios (día, motivo) con un único UPSERT. No hace commit."""
+    merged: Dict[Tuple[date, int], int] = {}
+    for (day, reason_id), delta in deltas.items():
+        key = (day, reason_id or NO_REASON)
+        merged[key] = merged.get(key, 0) + delta
+    if not merged:
+        return
+    stmt = insert(DailyReasonCount).values([
+        {"date": day, "reason_id": reason_id, "booked": delta}
+        for (day, reason_id), delta in merged.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DailyReasonCount.date, DailyReasonCount.reason_id],
+        set_={"booked": DailyReasonCount.booked + stmt.excluded.booked}
+    ))
+
+
+def record_capacity(db: Session, day: date, capacity_delta: int, slots_delta: int = 0):
+    """Suma plazas (y horarios) ofrecidos en el día. No hace commit."""
+    stmt = insert(DailyCapacity).values(date=day, slots=slots_delta, capacity=capacity_delta)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DailyCapacity.date],
+        set_={
+            "slots": DailyCapacity.slots + stmt.excluded.slots,
+            "capacity": DailyCapacity.capacity + stmt.excluded.capacity
+        }
+    ))
+
+
+def _fresh_counts(db: Session) -> Tuple[Dict[date, Tuple[int, int]], Dict[Tuple[date, int], int]]:
+    history = appointment_history()
+    capacity = {
+        r[0]: (r[1], r[2]) for r in
+        db.query(AvailableSlot.date, func.count(), func.sum(AvailableSlot.capacity))
+        .group_by(AvailableSlot.date)
+        .all()
+    }
+    booked = {
+        (r[0], r[1] or NO_REASON): r[2] for r in
+        db.query(history.c.date, history.c.reason_id, func.count())
+        .group_by(history.c.date, history.c.reason_id)
+        .all()
+    }
+    return capacity, booked
+
+
+def rebuild_stats(db: Session) -> int:
+    """
+    Recalcula las tablas de resumen desde cero y las reemplaza.
+
+    Devuelve cuántas filas del resumen anterior no coincidían con el recálculo.
+    La capacidad de días cuyos horarios ya se podaron no se puede reconstruir
+    y se conserva tal cual.
+    """
+    capacity, booked = _fresh_counts(db)
+
+    stored_capacity = {r.date: (r.slots, r.capacity) for r in db.query(DailyCapacity).all()}
+    stored_booked = {(r.date, r.reason_id): r.booked for r in db.query(DailyReasonCount).all()}
+
+    mismatches = sum(
+        1 for day, value in capacity.items() if stored_capacity.get(day) != value
+    ) + sum(
+        1 for key in set(booked) | set(stored_booked)
+        if booked.get(key, 0) != stored_booked.get(key, 0)
+    )
+
+    db.execute(delete(DailyReasonCount))
+    if booked:
+        db.execute(insert(DailyReasonCount), [
+            {"date": d, "reason_id": r, "booked": n} for (d, r), n in booked.items()
+        ])
+
+    db.execute(delete(DailyCapacity).where(DailyCapacity.date.in_(list(capacity))))
+    if capacity:
+        db.execute(insert(DailyCapacity), [
+            {"date": d, "slots": s, "capacity": c} for d, (s, c) in capacity.items()
+        ])
+
+    db.commit()
+    return mismatches
@@ -0,0 +1,93 @@
+# =========================================================
+# 📁 app/core/waitlist.py — Promoción desde la lista de espera
+# =========================================================
+from datetime import date, time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Appointment, AvailableSlot, WaitlistEntry
+from app.core.slots import (
+    reserve_seat,
+    reason_duration,
+    appointment_end,
+    lock_resource_days,
+    has_overlap
+)
+from app.core.stats import record_booking
+from app.core.calendar_feed import touch_calendar
+
+PROMOTION_CANDIDATES = 20  # primeras entradas en espera que se revisan al promover
+
+
+def promote_from_waitlist(db: Session, resource_id: int, slot_date: date,
+                          slot_time: time) -> Optional[Appointment]:
+    """
+    Convierte en cita la primera entrada en espera del horario, si hay plaza.
+
+    Se llama dentro de la transacción que acaba de liberar la plaza, así que la
+    cancelación y la promoción se confirman (o se deshacen) juntas. La búsqueda
+    usa el índice (slot_id, created_at) y bloquea solo las primeras entradas.
+    Se salta a quien pida un motivo cuya duración se solaparía con otra cita.
+    No hace commit; devuelve la cita creada o None.
+    """
+    db.flush()  # la cita cancelada/movida ya no debe contar como solape
+    # El llamador ya debe tenerlo tomado antes de liberar la plaza (si no, el orden
+    # de bloqueos se invierte respecto a una reserva); volver a pedirlo no cuesta nada
+    lock_resource_days(db, [(resource_id, slot_date)])
+    candidates = (
+        db.query(WaitlistEntry)
+        .join(AvailableSlot, AvailableSlot.id == WaitlistEntry.slot_id)
+        .filter(
+            AvailableSlot.resource_id == resource_id,
+            AvailableSlot.date == slot_date,
+            AvailableSlot.time == slot_time
+        )
+        .order_by(WaitlistEntry.created_at, WaitlistEntry.id)
+        .with_for_update(skip_locked=True, of=WaitlistEntry)
+        .limit(PROMOTION_CANDIDATES)
+        .all()
+    )
+    entry = end_time = None
+    for candidate in candidates:
+        try:
+            candidate_end = appointment_end(slot_time, reason_duration(candidate.reason))
+        except ValueError:
+            continue
+        if not has_overlap(db, resource_id, slot_date, slot_time, candidate_end):
+            entry, end_time = candidate, candidate_end
+            break
+    if entry is None:
+        return None
+
+    if not reserve_seat(db, resource_id, slot_date, slot_time):
+        return None
+
+    cita = Appointment(
+        resource_id=resource_id,
+        date=slot_date,
+        time=slot_time,
+        end_time=end_time,
+        user_id=entry.user_id,
+        reason_id=entry.reason_id
+    )
+    db.add(cita)
+    db.delete(entry)
+    record_booking(db, slot_date, entry.reason_id, 1)
+    touch_calendar(db, entry.user_id)
+    db.flush()
+    return cita
+
+
+def promotion_email(cita: Appointment):
+    """Datos del correo para el usuario promovido desde la lista de espera."""
+    subject = "¡Se liberó un horario! Tu cita está confirmada"
+    body = f"""
+    <h3>Hola {cita.user.full_name} 👋</h3>
+    <p>Se liberó una plaza en el horario que esperabas y tu cita quedó confirmada.</p>
+    <p><b>Fecha:</b> {cita.date.strftime("%Y-%m-%d")}<br>
+    <b>Hora:</b> {cita.time.strftime("%H:%M")}</p>
+    <p><b>Motivo:</b> {cita.reason.name if cita.reason else "Sin motivo"}</p>
+    <p>Si ya no puedes asistir, cancela la cita desde "Mis citas".</p>
+    """
+    return cita.user.email, subject, body
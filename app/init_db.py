@@ -1,5 +1,7 @@
 from app.database import engine
 from app.models import Base
+from app.core.schema_upgrade import upgrade_schema
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)  # añade columnas nuevas a tablas que ya existían
 print("✅ Tablas creadas en PostgreSQL")
\ No newline at end of file
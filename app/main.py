@@ -1,12 +1,26 @@
 from fastapi import FastAPI, Request, Depends
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, ORJSONResponse
 
-from app.database import engine, Base
-from app.routers import users, appointments, admin, public  # ← incluye el router público
+from app.database import engine, Base, SessionLocal
+from app.routers import users, appointments, admin, public, calendar  # ← incluye el router público
 from app.admin_auth import admin_required  # Middleware para validar admin
 from app import auth
+from app.core.availability_index import availability_index, REFRESH_SECONDS
+from app.core.slots import ensure_default_resource
+from app.core.jobs import job_runner
+from app.core.events import availability_hub
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.session_refresh import SessionRefreshMiddleware
+from app.core.static_assets import static_assets, static_url
+from app.core.profiling import ProfilingMiddleware
+from app.core.schema_upgrade import upgrade_schema
+
+from starlette.concurrency import run_in_threadpool
+
+import asyncio
 
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -14,18 +28,89 @@ logging.basicConfig(level=logging.DEBUG)
 # --------------------------------------------------
 # Inicializar la aplicación
 # --------------------------------------------------
-app = FastAPI(title="Sistema de Reservas de Citas")
+app = FastAPI(title="Sistema de Reservas de Citas", default_response_class=ORJSONResponse)
+
+# --------------------------------------------------
+# Middlewares
+# --------------------------------------------------
+app.add_middleware(ProfilingMiddleware)  # perfiles bajo demanda (?_profile=1, token firmado o muestreo)
+app.add_middleware(IdempotencyMiddleware)  # reintentos seguros de reservas/cancelaciones
+app.add_middleware(CompressionMiddleware)  # gzip para JSON/HTML grandes (no SSE ni /static)
+app.add_middleware(SessionRefreshMiddleware)  # renueva el access token antes que idempotencia
+app.add_middleware(RateLimitMiddleware)    # se ejecuta primero: corta ráfagas antes de trabajar
 
 # --------------------------------------------------
 # Archivos estáticos y templates
 # --------------------------------------------------
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", static_assets, name="static")  # huellas + variantes comprimidas, generadas al arrancar
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_url
 
 # --------------------------------------------------
-# Crear tablas en la base de datos
+# Crear tablas en la base de datos (y actualizar las que ya existían)
 # --------------------------------------------------
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
+# --------------------------------------------------
+# Cargar el índice de disponibilidad en memoria
+# --------------------------------------------------
+@app.on_event("startup")
+def load_availability_index():
+    db = SessionLocal()
+    try:
+        ensure_default_resource(db)
+        db.commit()  # el índice lee en una transacción propia (REPEATABLE READ)
+        availability_index.load(db)
+    finally:
+        db.close()
+
+
+def refresh_availability_index():
+    db = SessionLocal()
+    try:
+        availability_index.refresh_if_changed(db)
+    finally:
+        db.close()
+
+
+async def reconcile_availability_index():
+    """Recoge lo escrito por otros workers, tareas o cambios directos en la base."""
+    while True:
+        await asyncio.sleep(REFRESH_SECONDS)
+        try:
+            await run_in_threadpool(refresh_availability_index)
+        except Exception:
+            logging.exception("No se pudo refrescar el índice de disponibilidad")
+
+
+@app.on_event("startup")
+async def start_index_reconciliation():
+    if REFRESH_SECONDS > 0:
+        asyncio.create_task(reconcile_availability_index())
+
+
+@app.on_event("startup")
+async def bind_availability_hub():
+    availability_hub.bind(asyncio.get_running_loop())
+
+
+# --------------------------------------------------
+# Pool de procesos para tareas pesadas del admin
+# --------------------------------------------------
+@app.on_event("startup")
+def start_job_runner():
+    db = SessionLocal()
+    try:
+        job_runner.recover(db)
+    finally:
+        db.close()
+    job_runner.start()
+
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    job_runner.shutdown()
 
 # --------------------------------------------------
 # Registrar routers
@@ -35,6 +120,7 @@ app.include_router(appointments.router, prefix="/appointments", tags=["Citas"])
 app.include_router(admin.router, tags=["Admin"])
 app.include_router(public.router, tags=["Público"])  # ← acceso a motivos para usuarios
 app.include_router(auth.router)
+app.include_router(calendar.router)  # feeds .ics
 
 # --------------------------------------------------
 # Rutas principales
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, Time, ForeignKey, Boolean
+from sqlalchemy import (
+    Column, Integer, String, Date, Time, ForeignKey, Boolean,
+    UniqueConstraint, CheckConstraint, Index, DateTime, JSON, Text, BigInteger, func
+)
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -21,33 +24,126 @@ class User(Base):
     appointments = relationship("Appointment", back_populates="user")
 
 
+# ========================
+# Modelo de Recurso (profesional o sala)
+# ========================
+DEFAULT_RESOURCE_ID = 1  # 👈 recurso "General" que se crea al iniciar
+DEFAULT_DURATION_MINUTES = 30  # 👈 duración de una cita sin motivo o de un motivo nuevo
+
+
+class Resource(Base):
+    __tablename__ = "resources"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    kind = Column(String, nullable=False, default="practitioner")  # 👈 "practitioner" o "room"
+    is_active = Column(Boolean, nullable=False, default=True)
+
+
 # ========================
 # Modelo de Cita
 # ========================
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # (recurso, fecha, inicio, fin): la búsqueda de solapes se resuelve con el índice
+        Index("ix_appointments_resource_date_span", "resource_id", "date", "time", "end_time"),
+        Index("ix_appointments_user_date_time", "user_id", "date", "time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource_id = Column(
+        Integer, ForeignKey("resources.id"), nullable=False,
+        default=DEFAULT_RESOURCE_ID, server_default=str(DEFAULT_RESOURCE_ID)
+    )
     reason_id = Column(Integer, ForeignKey("reasons.id"), nullable=True)  # 🔹 Nueva relación con Reason
     date = Column(Date, nullable=False)
     time = Column(Time, nullable=False)  # <-- TIME en vez de STRING
+    end_time = Column(Time, nullable=False)  # 👈 fin (exclusivo): inicio + duración del motivo
 
     # Relaciones
     user = relationship("User", back_populates="appointments")
     reason = relationship("Reason", back_populates="appointments")  # 🔹 Permite acceder a reason.name
+    resource = relationship("Resource")
+
 
 
+# ========================
+# Modelo de Cita Archivada (histórico frío)
+# ========================
+class AppointmentArchive(Base):
+    __tablename__ = "appointments_archive"
+    __table_args__ = (
+        Index("ix_appointments_archive_date", "date"),
+        Index("ix_appointments_archive_user_id", "user_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # 👈 conserva el id original
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=True)
+    reason_id = Column(Integer, ForeignKey("reasons.id"), nullable=True)
+    date = Column(Date, nullable=False)
+    time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=True)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
 
 # ========================
 # Modelo de Horario Disponible
 # ========================
 class AvailableSlot(Base):
     __tablename__ = "available_slots"
+    __table_args__ = (
+        UniqueConstraint("resource_id", "date", "time", name="uq_available_slots_resource_date_time"),
+        CheckConstraint(
+            "booked_count >= 0 AND booked_count <= capacity",
+            name="ck_available_slots_booked_count"
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    resource_id = Column(
+        Integer, ForeignKey("resources.id"), nullable=False,
+        default=DEFAULT_RESOURCE_ID, server_default=str(DEFAULT_RESOURCE_ID)
+    )
     date = Column(Date, nullable=False)
     time = Column(Time, nullable=False)  # <-- También TIME para que sea consistente
+    capacity = Column(Integer, nullable=False, default=1, server_default="1")  # 👈 plazas del horario
+    booked_count = Column(Integer, nullable=False, default=0, server_default="0")  # 👈 plazas ocupadas
+
+
+# ========================
+# Versión de la disponibilidad por (recurso, día)
+# ========================
+class AvailabilityVersion(Base):
+    __tablename__ = "availability_versions"
+
+    resource_id = Column(Integer, ForeignKey("resources.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")  # 👈 +1 por transacción
+    txid = Column(BigInteger, nullable=True)  # 👈 última transacción que la subió
+
+
+# ========================
+# Modelo de Lista de Espera
+# ========================
+class WaitlistEntry(Base):
+    __tablename__ = "waitlist_entries"
+    __table_args__ = (
+        UniqueConstraint("slot_id", "user_id", name="uq_waitlist_slot_user"),
+        Index("ix_waitlist_slot_created", "slot_id", "created_at", "id"),  # 👈 siguiente en la cola
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    slot_id = Column(Integer, ForeignKey("available_slots.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    reason_id = Column(Integer, ForeignKey("reasons.id"), nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    slot = relationship("AvailableSlot")
+    user = relationship("User")
+    reason = relationship("Reason")
 
 
 # ========================
@@ -58,5 +154,76 @@ class Reason(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
+    duration_minutes = Column(
+        Integer, nullable=False,
+        default=DEFAULT_DURATION_MINUTES, server_default=str(DEFAULT_DURATION_MINUTES)
+    )
 
     appointments = relationship("Appointment", back_populates="reason")
+
+
+# ========================
+# Estadísticas diarias (mantenidas de forma incremental)
+# ========================
+class DailyCapacity(Base):
+    __tablename__ = "daily_capacity"
+
+    date = Column(Date, primary_key=True)
+    slots = Column(Integer, nullable=False, default=0, server_default="0")     # horarios del día
+    capacity = Column(Integer, nullable=False, default=0, server_default="0")  # plazas totales
+
+
+class DailyReasonCount(Base):
+    __tablename__ = "daily_reason_counts"
+
+    date = Column(Date, primary_key=True)
+    reason_id = Column(Integer, primary_key=True)  # 👈 0 = sin motivo (sin FK para poder usar 0)
+    booked = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# ========================
+# Sello de cambios de los calendarios (.ics)
+# ========================
+class CalendarStamp(Base):
+    __tablename__ = "calendar_stamps"
+
+    scope = Column(String, primary_key=True)  # 👈 "user:<id>" o "all"
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+# ========================
+# Refresh tokens (rotativos, guardados como hash)
+# ========================
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)  # 👈 sha256, nunca el token
+    family_id = Column(String(32), index=True, nullable=False)  # 👈 cadena de rotaciones de una sesión
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    rotated_at = Column(DateTime, nullable=True)  # 👈 canjeado por otro (no revocado por logout o robo)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+# ========================
+# Tareas en segundo plano (operaciones pesadas del admin)
+# ========================
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # 👈 "generate_slots", "export_appointments", ...
+    params = Column(JSON, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued/running/done/failed/cancelled
+    progress = Column(Integer, nullable=False, default=0, server_default="0")  # 👈 porcentaje 0-100
+    cancel_requested = Column(Boolean, nullable=False, default=False, server_default="false")
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    owner = Column(String(100), nullable=True)  # 👈 "host:pid" del proceso web que la lanzó
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
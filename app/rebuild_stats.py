@@ -0,0 +1,14 @@
+from app.database import SessionLocal
+from app.core.stats import rebuild_stats
+
+# Uso: python -m app.rebuild_stats
+db = SessionLocal()
+try:
+    mismatches = rebuild_stats(db)
+finally:
+    db.close()
+
+if mismatches:
+    print(f"⚠️ Estadísticas reconstruidas: {mismatches} filas no coincidían con el resumen incremental")
+else:
+    print("✅ Estadísticas reconstruidas: el resumen incremental era correcto")
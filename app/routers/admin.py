@@ -1,5 +1,7 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse, FileResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.auth import get_current_user_from_cookie
@@ -8,8 +10,36 @@ from app.models import User, Appointment, AvailableSlot
 from app.schemas import SlotCreate
 from app.auth import get_current_user
 from app.admin_auth import verify_admin
-from app.models import Reason
-from app.schemas import ReasonCreate
+from app.models import Reason, DailyCapacity, DailyReasonCount, Resource, Job, DEFAULT_RESOURCE_ID
+from app.schemas import ReasonCreate, ResourceCreate, JobCreate, BulkBookingCreate, BulkCancelRequest
+from app.schemas import (
+    MessageOut,
+    SlotOut,
+    SlotCreatedOut,
+    AdminAppointmentOut,
+    ReasonOut,
+    ReasonAddedOut,
+    DailyStatsOut,
+    ResourceOut,
+    JobOut,
+    BulkResultOut
+)
+from app.core.availability_index import availability_index
+from app.core.events import notify_slot_change
+from app.core.archive import appointment_history
+from app.core.stats import record_capacity, NO_REASON
+from app.core.jobs import job_runner, JOB_KINDS
+from app.core.profiling import profile_store, profile_token, PROFILE_HEADER, TOKEN_TTL_SECONDS
+from app.core.bulk import (
+    bulk_book,
+    bulk_cancel,
+    booking_summary_email,
+    cancellation_emails,
+    MAX_BULK_ITEMS
+)
+from app.core.slots import appointment_minutes, find_reason
+from app.core.waitlist import promote_from_waitlist, promotion_email
+from app.core.email_utils import send_bulk_emails
 
 # ============================================================
 # Router de administración
@@ -38,6 +68,8 @@ class SlotCreate(BaseModel):
     """
     date: str  # Formato: YYYY-MM-DD
     time: str  # Formato: HH:MM
+    capacity: int = 1  # Número de plazas (sesiones grupales / varios profesionales)
+    resource_id: int = DEFAULT_RESOURCE_ID  # Profesional o sala al que pertenece
 
 # ============================================================
 # ENDPOINTS DE ADMINISTRACIÓN
@@ -45,7 +77,7 @@ class SlotCreate(BaseModel):
 
 
 
-@router.post("/create-slot", status_code=201)
+@router.post("/create-slot", status_code=201, response_model=SlotCreatedOut)
 def create_slot(
     slot: SlotCreate,
     db: Session = Depends(get_db),
@@ -63,8 +95,15 @@ def create_slot(
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha u hora inválido")
 
-    # 🔍 Verificar si el slot ya existe
+    if slot.capacity < 1:
+        raise HTTPException(status_code=400, detail="La capacidad debe ser al menos 1")
+
+    if not db.get(Resource, slot.resource_id):
+        raise HTTPException(status_code=404, detail="Recurso no encontrado")
+
+    # 🔍 Verificar si el slot ya existe para ese recurso
     existing_slot = db.query(AvailableSlot).filter(
+        AvailableSlot.resource_id == slot.resource_id,
         AvailableSlot.date == date_obj,
         AvailableSlot.time == time_obj
     ).first()
@@ -73,16 +112,25 @@ def create_slot(
         raise HTTPException(status_code=400, detail="El horario ya existe")
 
     # ✅ Crear nuevo slot
-    new_slot = AvailableSlot(date=date_obj, time=time_obj)
+    new_slot = AvailableSlot(
+        resource_id=slot.resource_id, date=date_obj, time=time_obj, capacity=slot.capacity
+    )
     db.add(new_slot)
+    record_capacity(db, date_obj, slot.capacity, 1)
     db.commit()
     db.refresh(new_slot)
+    availability_index.add_slot(slot.resource_id, new_slot.date, new_slot.time, new_slot.capacity)
+    notify_slot_change(slot.resource_id, new_slot.date, new_slot.time)
 
     return {
         "message": "✅ Horario agregado correctamente",
         "slot": {
-            "date": slot.date,
-            "time": slot.time
+            "id": new_slot.id,
+            "resource_id": new_slot.resource_id,
+            "date": new_slot.date,
+            "time": slot.time,
+            "capacity": new_slot.capacity,
+            "booked_count": new_slot.booked_count
         }
     }
 
@@ -93,71 +141,382 @@ def create_slot(
 #============================================================   
 
 
-@router.get("/slots")
+@router.get("/slots", response_model=List[SlotOut])
 def list_slots(db: Session = Depends(get_db)):
     """Obtener todos los horarios disponibles ordenados por fecha y hora."""
-    slots = db.query(AvailableSlot).order_by(AvailableSlot.date, AvailableSlot.time).all()
-    return [
-        {"id": s.id, "date": s.date.strftime("%Y-%m-%d"), "time": s.time.strftime("%H:%M")}
-        for s in slots
-    ]
+    rows = (
+        db.query(
+            AvailableSlot.id,
+            AvailableSlot.resource_id,
+            AvailableSlot.date,
+            AvailableSlot.time,
+            AvailableSlot.capacity,
+            AvailableSlot.booked_count
+        )
+        .order_by(AvailableSlot.date, AvailableSlot.time, AvailableSlot.resource_id)
+        .all()
+    )
+    # Listado grande: se devuelve directamente con orjson, sin revalidar cada fila
+    return ORJSONResponse([
+        {
+            "id": r[0],
+            "resource_id": r[1],
+            "date": r[2],
+            "time": r[3].isoformat(timespec="minutes"),
+            "capacity": r[4],
+            "booked_count": r[5]
+        }
+        for r in rows
+    ])
 
 
 
-@router.get("/appointments")
-def list_appointments(db: Session = Depends(get_db)):
-    appointments = (
-        db.query(Appointment)
-        .join(Appointment.user)
-        .outerjoin(Appointment.reason)
-        .order_by(Appointment.date, Appointment.time)
+@router.get("/appointments", response_model=List[AdminAppointmentOut])
+def list_appointments(
+    include_archived: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(verify_admin)
+):
+    # Histórico completo (vigentes + archivadas) o solo las citas vigentes
+    source = appointment_history() if include_archived else Appointment.__table__
+    rows = (
+        db.query(
+            source.c.id, User.full_name, source.c.date, source.c.time,
+            Reason.name, Resource.name, source.c.end_time
+        )
+        .join(User, User.id == source.c.user_id)
+        .outerjoin(Reason, Reason.id == source.c.reason_id)
+        .outerjoin(Resource, Resource.id == source.c.resource_id)
+        .order_by(source.c.date, source.c.time)
         .all()
     )
 
-    return [
+    # Listado grande: se devuelve directamente con orjson, sin revalidar cada fila
+    return ORJSONResponse([
         {
-            "id": a.id,
-            "user_name": a.user.full_name,
-            "date": a.date.strftime("%Y-%m-%d"),
-            "time": a.time.strftime("%H:%M"),
-            "reason_name": a.reason.name if a.reason else "Sin motivo"
+            "id": r[0],
+            "user_name": r[1],
+            "date": r[2],
+            "time": r[3].isoformat(timespec="minutes"),
+            "reason_name": r[4] or "Sin motivo",
+            "resource_name": r[5],
+            "end_time": r[6].isoformat(timespec="minutes") if r[6] else None
         }
-        for a in appointments
-    ]
+        for r in rows
+    ])
+
+
+
+
+
+# ============================================================
+# OPERACIONES EN LOTE (recepción e integraciones)
+# ============================================================
+
+@router.post("/appointments/bulk-create", response_model=BulkResultOut)
+def bulk_create_appointments(
+    data: BulkBookingCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(verify_admin)
+):
+    """Reserva una serie de citas para un usuario en una sola transacción."""
+    if not data.items or data.repeat < 1 or data.every_days < 1:
+        raise HTTPException(status_code=400, detail="Indica al menos un horario y una repetición válida")
+    if len(data.items) * data.repeat > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_ITEMS} citas por lote")
+
+    user = db.get(User, data.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    resource = db.get(Resource, data.resource_id)
+    if not resource or not resource.is_active:
+        raise HTTPException(status_code=404, detail="Recurso no encontrado")
+    reason = find_reason(db, data.reason) if data.reason else None
+    if data.reason and not reason:
+        raise HTTPException(status_code=404, detail="Motivo no encontrado")
+
+    results, booked = bulk_book(
+        db, user.id, resource.id, reason,
+        [(item.date, item.time) for item in data.items],
+        repeat=data.repeat,
+        every_days=data.every_days,
+        all_or_nothing=data.all_or_nothing
+    )
+    email = booking_summary_email(user, reason, booked) if booked else None
+    db.commit()
+
+    for b in booked:
+        availability_index.book(b.resource_id, b.date, b.time, b.duration)
+    for b in booked:
+        notify_slot_change(b.resource_id, b.date, b.time, b.duration)
+    if email:
+        background_tasks.add_task(send_bulk_emails, [email])
+
+    return {
+        "message": f"{len(booked)} citas reservadas",
+        "applied": len(booked),
+        "failed": len(results) - len(booked),
+        "results": results
+    }
+
+
+@router.post("/appointments/bulk-cancel", response_model=BulkResultOut)
+def bulk_cancel_appointments(
+    data: BulkCancelRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(verify_admin)
+):
+    """Cancela varias citas (por id o un día completo) en una sola transacción."""
+    if (data.ids is None) == (data.date is None):
+        raise HTTPException(status_code=400, detail="Indica `ids` o `date`, no ambos")
+    if data.ids is not None and len(data.ids) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_ITEMS} citas por lote")
+    day = None
+    if data.date is not None:
+        try:
+            day = datetime.strptime(data.date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido")
+
+    results, cancelled = bulk_cancel(db, data.ids, day, data.resource_id)
+    messages = cancellation_emails(cancelled)
+
+    # Opcional: ofrecer cada plaza liberada a la lista de espera
+    promoted = []
+    if data.promote_waitlist:
+        freed = {}
+        for c in cancelled:
+            key = (c.resource_id, c.date, c.time)
+            freed[key] = freed.get(key, 0) + 1
+        for key, seats in freed.items():
+            for _ in range(seats):
+                cita = promote_from_waitlist(db, *key)
+                if cita is None:
+                    break
+                promoted.append(cita)
+        messages += [promotion_email(cita) for cita in promoted]
+    db.commit()
+
+    spans = {}
+    for c in cancelled:
+        key = (c.resource_id, c.date, c.time)
+        availability_index.release(*key, c.duration)
+        spans[key] = max(spans.get(key, 1), c.duration)
+    for cita in promoted:
+        key = (cita.resource_id, cita.date, cita.time)
+        duration = appointment_minutes(cita.time, cita.end_time)
+        availability_index.book(*key, duration)
+        spans[key] = max(spans.get(key, 1), duration)
+    for key, span in spans.items():
+        notify_slot_change(*key, span)
+    if messages:
+        background_tasks.add_task(send_bulk_emails, messages)
+
+    return {
+        "message": f"{len(cancelled)} citas canceladas",
+        "applied": len(cancelled),
+        "failed": len(results) - len(cancelled),
+        "results": results
+    }
+
+
+@router.get("/stats", response_model=List[DailyStatsOut])
+def daily_stats(
+    start: str,
+    end: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(verify_admin)
+):
+    """Ocupación por día y por motivo, leída del resumen incremental (O(días))."""
+    try:
+        start_date = datetime.strptime(start, "%Y-%m-%d").date()
+        end_date = datetime.strptime(end, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido")
+
+    capacity_rows = (
+        db.query(DailyCapacity)
+        .filter(DailyCapacity.date.between(start_date, end_date))
+        .all()
+    )
+    count_rows = (
+        db.query(DailyReasonCount.date, DailyReasonCount.reason_id, Reason.name, DailyReasonCount.booked)
+        .outerjoin(Reason, Reason.id == DailyReasonCount.reason_id)
+        .filter(
+            DailyReasonCount.date.between(start_date, end_date),
+            DailyReasonCount.booked != 0
+        )
+        .order_by(DailyReasonCount.date, DailyReasonCount.reason_id)
+        .all()
+    )
 
+    days = {
+        c.date: {"date": c.date, "slots": c.slots, "capacity": c.capacity, "booked": 0, "by_reason": []}
+        for c in capacity_rows
+    }
+    for day, reason_id, reason_name, booked in count_rows:
+        entry = days.setdefault(day, {"date": day, "slots": 0, "capacity": 0, "booked": 0, "by_reason": []})
+        entry["booked"] += booked
+        entry["by_reason"].append({
+            "reason_id": None if reason_id == NO_REASON else reason_id,
+            "reason_name": reason_name or "Sin motivo",
+            "booked": booked
+        })
+
+    for entry in days.values():
+        entry["occupancy_rate"] = (
+            round(entry["booked"] / entry["capacity"], 4) if entry["capacity"] else None
+        )
+
+    return [days[d] for d in sorted(days)]
 
 
 
 
+
+# ============================================================
+# TAREAS EN SEGUNDO PLANO
+# ============================================================
+
+@router.post("/jobs", status_code=202, response_model=JobOut)
+def create_job(job: JobCreate, db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
+    """Lanza una operación pesada y devuelve su id al momento; el avance se consulta en /admin/jobs/{id}."""
+    if job.kind not in JOB_KINDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de tarea desconocido. Disponibles: {', '.join(JOB_KINDS)}"
+        )
+    return job_runner.submit(db, job.kind, job.params, current_user.id)
+
+
+@router.get("/jobs", response_model=List[JobOut])
+def list_jobs(limit: int = 50, db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
+    return db.query(Job).order_by(Job.id.desc()).limit(min(limit, 500)).all()
+
+
+def _get_job(db: Session, job_id: int) -> Job:
+    job = db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
+    return _get_job(db, job_id)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobOut)
+def cancel_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
+    job = _get_job(db, job_id)
+    if job.status not in ("queued", "running"):
+        raise HTTPException(status_code=400, detail="La tarea ya terminó")
+    return job_runner.cancel(db, job)
+
+
+@router.get("/jobs/{job_id}/result")
+def job_result(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
+    """Resultado de una tarea terminada; las exportaciones se descargan como archivo."""
+    job = _get_job(db, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"La tarea no ha terminado (estado: {job.status})")
+
+    result = job.result or {}
+    if result.get("file"):
+        return FileResponse(
+            result["file"],
+            media_type="text/csv",
+            filename=f"{job.kind}-{job.id}.csv"
+        )
+    return result
+
+
+# ============================================================
+# PERFILES DE PETICIONES
+# ============================================================
+
+@router.post("/profiles/token")
+def create_profile_token(current_user: User = Depends(verify_admin)):
+    """Token firmado para perfilar peticiones enviando el encabezado X-Profile-Token."""
+    return {
+        "header": PROFILE_HEADER,
+        "token": profile_token(current_user.id),
+        "expires_in": TOKEN_TTL_SECONDS
+    }
+
+
+@router.get("/profiles")
+def list_profiles(current_user: User = Depends(verify_admin)):
+    """Perfiles guardados (más recientes primero), sin las pilas ni el SQL completo."""
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, current_user: User = Depends(verify_admin)):
+    path = profile_store.path_for(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+
+
 # ============================================================
 # ENDPOINTS ADICIONALES (Opcionales)
 # ============================================================  
 
-@router.delete("/delete-slot/{slot_id}")
+@router.delete("/delete-slot/{slot_id}", response_model=MessageOut)
 def delete_slot(slot_id: int, db: Session = Depends(get_db), user: User = Depends(verify_admin)):
     slot = db.query(AvailableSlot).filter_by(id=slot_id).first()
     if not slot:
         raise HTTPException(status_code=404, detail="Slot no encontrado")
+    if slot.booked_count > 0:
+        raise HTTPException(status_code=400, detail="El horario tiene citas reservadas")
+    resource_id, slot_date, slot_time = slot.resource_id, slot.date, slot.time
+    record_capacity(db, slot_date, -slot.capacity, -1)
     db.delete(slot)
     db.commit()
+    availability_index.remove_slot(resource_id, slot_date, slot_time)
+    notify_slot_change(resource_id, slot_date, slot_time)
     return {"message": "Slot eliminado correctamente"}
 
+# ----- Recursos (profesionales / salas)
+
+@router.get("/resources", response_model=List[ResourceOut])
+def get_resources(db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
+    return db.query(Resource).order_by(Resource.id).all()
+
+
+@router.post("/add-resource", status_code=201, response_model=ResourceOut)
+def add_resource(resource: ResourceCreate, db: Session = Depends(get_db), user: User = Depends(verify_admin)):
+    existing = db.query(Resource).filter_by(name=resource.name).first()
+    if existing:
+        raise HTTPException(status_code=400, detail="Este recurso ya existe")
+
+    new_resource = Resource(name=resource.name, kind=resource.kind)
+    db.add(new_resource)
+    db.commit()
+    db.refresh(new_resource)
+    return new_resource
+
 # ----- Obtener motivos disponibles para citas
 
-@router.get("/reasons")
+@router.get("/reasons", response_model=List[ReasonOut])
 def get_reasons(db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
-    reasons = db.query(Reason).all()
-    return [{"id": r.id, "name": r.name} for r in reasons]
+    return db.query(Reason).all()
 
 
 # Agregar motivo
-@router.post("/add-reason")
+@router.post("/add-reason", response_model=ReasonAddedOut)
 def add_reason(reason: ReasonCreate, db: Session = Depends(get_db), user: User = Depends(verify_admin)):
     existing = db.query(Reason).filter_by(name=reason.name).first()
     if existing:
         raise HTTPException(status_code=400, detail="Este motivo ya existe")
 
-    new_reason = Reason(name=reason.name)
+    if reason.duration_minutes < 1:
+        raise HTTPException(status_code=400, detail="La duración debe ser de al menos 1 minuto")
+
+    new_reason = Reason(name=reason.name, duration_minutes=reason.duration_minutes)
     db.add(new_reason)
     db.commit()
     db.refresh(new_reason)
@@ -165,7 +524,7 @@ def add_reason(reason: ReasonCreate, db: Session = Depends(get_db), user: User =
 
 # Eliminar motivo
 
-@router.delete("/delete-reason/{reason_id}")
+@router.delete("/delete-reason/{reason_id}", response_model=MessageOut)
 def delete_reason(reason_id: int, db: Session = Depends(get_db), current_user: User = Depends(verify_admin)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="No autorizado")
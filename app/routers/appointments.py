@@ -1,13 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from app.database import get_db
-from app.models import Appointment, AvailableSlot, User, Reason
+from app.models import (
+    Appointment, AvailableSlot, User, Reason, WaitlistEntry, Resource,
+    DEFAULT_RESOURCE_ID, DEFAULT_DURATION_MINUTES
+)
 from app.auth import get_current_user_from_cookie
+from app.schemas import (
+    SlotCreatedOut,
+    NextFreeSlotOut,
+    AppointmentCreateOut,
+    AppointmentReschedule,
+    MessageOut,
+    WaitlistJoinOut,
+    WaitlistEntryOut
+)
 from app.core.email_utils import send_email   # 👈 Nuevo import
-import asyncio                                 # 👈 Para enviar el correo en segundo plano
+from app.core.slots import (
+    reserve_seat,
+    release_seat,
+    find_reason,
+    reason_duration,
+    appointment_end,
+    appointment_minutes,
+    lock_resource_days,
+    has_overlap
+)
+from app.core.waitlist import promote_from_waitlist, promotion_email
+from app.core.stats import record_booking, record_capacity
+from app.core.calendar_feed import touch_calendar
+from app.core.availability_index import availability_index
+from app.core.events import (
+    availability_hub,
+    notify_slot_change,
+    format_sse,
+    KEEPALIVE_SECONDS,
+    MAX_DATES_PER_CLIENT
+)
+import asyncio
 
 router = APIRouter()
 
@@ -15,68 +50,212 @@ router = APIRouter()
 class SlotCreate(BaseModel):
     date: str  # formato YYYY-MM-DD
     time: str  # formato HH:MM
+    capacity: int = 1  # 👈 número de plazas del horario
+    resource_id: int = DEFAULT_RESOURCE_ID  # 👈 profesional o sala
 
 class AppointmentCreate(BaseModel):
     date: str
     time: str
     reason: Optional[str] = None  # 👈 motivo de la cita
+    resource_id: int = DEFAULT_RESOURCE_ID  # 👈 profesional o sala
+
+
+def _find_reason(db: Session, value: Optional[str]) -> Optional[Reason]:
+    """Busca el motivo por id o por nombre; 404 si se indicó y no existe."""
+    if not value:
+        return None
+    reason_obj = find_reason(db, value)
+    if not reason_obj:
+        raise HTTPException(status_code=404, detail="Motivo no encontrado")
+    return reason_obj
+
+
+def _check_duration(duration: int):
+    if duration < 1:
+        raise HTTPException(status_code=400, detail="La duración debe ser de al menos 1 minuto")
+
+
+def _check_resource(db: Session, resource_id: int) -> Resource:
+    """Comprueba que el recurso exista y esté activo; 404 si no."""
+    resource = db.get(Resource, resource_id)
+    if not resource or not resource.is_active:
+        raise HTTPException(status_code=404, detail="Recurso no encontrado")
+    return resource
 
 
 # 1️⃣ ADMIN — Agregar un horario disponible
-@router.post("/add-slot")
-def add_available_slot(slot: SlotCreate, db: Session = Depends(get_db)):
+@router.post("/add-slot", response_model=SlotCreatedOut)
+def add_available_slot(
+    slot: SlotCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    # Escribe capacidad, estadísticas y eventos en vivo: solo administradores
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="No tienes permisos de administrador.")
+
     try:
         date_obj = datetime.strptime(slot.date, "%Y-%m-%d").date()
         time_obj = datetime.strptime(slot.time, "%H:%M").time()
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha u hora inválido")
 
-    new_slot = AvailableSlot(date=date_obj, time=time_obj)
+    if slot.capacity < 1:
+        raise HTTPException(status_code=400, detail="La capacidad debe ser al menos 1")
+
+    _check_resource(db, slot.resource_id)
+
+    existing_slot = db.query(AvailableSlot).filter(
+        AvailableSlot.resource_id == slot.resource_id,
+        AvailableSlot.date == date_obj,
+        AvailableSlot.time == time_obj
+    ).first()
+    if existing_slot:
+        raise HTTPException(status_code=400, detail="El horario ya existe")
+
+    new_slot = AvailableSlot(
+        resource_id=slot.resource_id, date=date_obj, time=time_obj, capacity=slot.capacity
+    )
     db.add(new_slot)
+    record_capacity(db, date_obj, slot.capacity, 1)
     db.commit()
     db.refresh(new_slot)
+    availability_index.add_slot(slot.resource_id, new_slot.date, new_slot.time, new_slot.capacity)
+    notify_slot_change(slot.resource_id, new_slot.date, new_slot.time)
 
     return {
         "message": "Horario agregado",
-        "slot": {"date": slot.date, "time": slot.time}
+        "slot": {
+            "id": new_slot.id,
+            "resource_id": new_slot.resource_id,
+            "date": new_slot.date,
+            "time": slot.time,
+            "capacity": new_slot.capacity,
+            "booked_count": new_slot.booked_count
+        }
     }
 
 
 # 2️⃣ Usuario — Obtener horarios libres para una fecha
-@router.get("/available")
-def get_available_slots(date: str, db: Session = Depends(get_db)):
+@router.get("/available", response_model=List[str])
+def get_available_slots(
+    date: str,
+    resource_id: int = DEFAULT_RESOURCE_ID,
+    duration: int = DEFAULT_DURATION_MINUTES
+):
     try:
         date_obj = datetime.strptime(date, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha inválido")
+    _check_duration(duration)
 
-    horarios_disponibles = (
-        db.query(AvailableSlot)
-        .filter(AvailableSlot.date == date_obj)
-        .order_by(AvailableSlot.time)
-        .all()
-    )
+    # Se responde desde el índice en memoria, sin consultar la base de datos.
+    # `duration` (minutos, la del motivo elegido) descarta inicios que se solaparían.
+    return [
+        t.isoformat(timespec="minutes")
+        for t in availability_index.free_times(resource_id, date_obj, duration)
+    ]
 
-    citas_ocupadas = (
-        db.query(Appointment.time)
-        .filter(Appointment.date == date_obj)
-        .all()
-    )
-    horas_ocupadas = {c[0].strftime("%H:%M") for c in citas_ocupadas}
 
-    horas_libres = [
-        slot.time.strftime("%H:%M")
-        for slot in horarios_disponibles
-        if slot.time.strftime("%H:%M") not in horas_ocupadas
+# 2️⃣.0 Usuario — Horarios completos de una fecha (para la lista de espera)
+@router.get("/full", response_model=List[str])
+def get_full_slots(date: str, resource_id: int = DEFAULT_RESOURCE_ID):
+    try:
+        date_obj = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido")
+
+    # `/available` los oculta; sin esta lista la espera solo se ofrecería tras perder una carrera
+    return [
+        t.isoformat(timespec="minutes")
+        for t in availability_index.full_times(resource_id, date_obj)
     ]
 
-    return horas_libres
+
+# 2️⃣.1 Usuario — Primer horario libre a partir de una fecha/hora
+@router.get("/next-free", response_model=NextFreeSlotOut)
+def get_next_free_slot(
+    after: Optional[str] = None,
+    duration: int = DEFAULT_DURATION_MINUTES,
+    resource_id: int = DEFAULT_RESOURCE_ID
+):
+    try:
+        after_dt = datetime.strptime(after, "%Y-%m-%dT%H:%M") if after else datetime.now()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DDTHH:MM)")
+
+    _check_duration(duration)
+
+    found = availability_index.first_free_after(resource_id, after_dt, duration)
+    if not found:
+        return {"date": None, "time": None}
+
+    return {"date": found[0].isoformat(), "time": found[1].isoformat(timespec="minutes")}
+
+
+# 2️⃣.2 Usuario — Días con horarios libres en un mes
+@router.get("/free-days", response_model=List[str])
+def get_free_days(
+    month: str,
+    duration: int = DEFAULT_DURATION_MINUTES,
+    resource_id: int = DEFAULT_RESOURCE_ID
+):
+    try:
+        month_obj = datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de mes inválido (YYYY-MM)")
+
+    _check_duration(duration)
+
+    days = availability_index.free_days(resource_id, month_obj.year, month_obj.month, duration)
+    return [d.isoformat() for d in days]
+
+
+# 2️⃣.3 Usuario — Eventos en vivo (SSE) de horarios ocupados/liberados
+@router.get("/stream")
+async def stream_availability(request: Request, dates: str, resource_id: int = DEFAULT_RESOURCE_ID):
+    try:
+        date_objs = {
+            datetime.strptime(d.strip(), "%Y-%m-%d").date()
+            for d in dates.split(",") if d.strip()
+        }
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido")
+
+    if not date_objs or len(date_objs) > MAX_DATES_PER_CLIENT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Indica entre 1 y {MAX_DATES_PER_CLIENT} fechas"
+        )
+
+    queue = availability_hub.subscribe(resource_id, date_objs)
+
+    async def event_generator():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            availability_hub.unsubscribe(queue, resource_id, date_objs)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # 3️⃣ Usuario — Crear una cita (usando token)
-@router.post("/create")
-async def create_appointment(
+@router.post("/create", response_model=AppointmentCreateOut, response_model_exclude_none=True)
+def create_appointment(
     appt: AppointmentCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_cookie)
 ):
@@ -86,35 +265,55 @@ async def create_appointment(
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha u hora inválido")
 
-    # Verificar si ya existe una cita en esa hora
-    cita_existente = db.query(Appointment).filter(
+    # Buscar el motivo (por id o nombre) y el recurso
+    reason_obj = _find_reason(db, appt.reason)
+    _check_resource(db, appt.resource_id)
+    duration = reason_duration(reason_obj)
+    try:
+        end_obj = appointment_end(time_obj, duration)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Con el día del recurso bloqueado, un reintento que llegue a otro worker
+    # espera a la reserva original y ve su cita en la comprobación siguiente
+    lock_resource_days(db, [(appt.resource_id, date_obj)])
+
+    # El mismo usuario no puede ocupar dos plazas del mismo horario
+    cita_existente = db.query(Appointment.id).filter(
+        Appointment.user_id == current_user.id,
         Appointment.date == date_obj,
         Appointment.time == time_obj
     ).first()
 
     if cita_existente:
-        return {"error": "Horario no disponible"}
+        db.rollback()
+        return {"error": "Ya tienes una cita en este horario"}
 
-    # Buscar el motivo (por id)
-    reason_obj = None
-    if appt.reason:
-        reason_obj = db.query(Reason).filter(
-            (Reason.id == appt.reason) | (Reason.name == appt.reason)
-        ).first()
-        if not reason_obj:
-            raise HTTPException(status_code=404, detail="Motivo no encontrado")
+    # Que no se solape con otra cita y ocupar una plaza de forma atómica (UPDATE condicional)
+    if (
+        has_overlap(db, appt.resource_id, date_obj, time_obj, end_obj)
+        or not reserve_seat(db, appt.resource_id, date_obj, time_obj)
+    ):
+        db.rollback()
+        return {"error": "Horario no disponible"}
 
     # Crear la cita con el ID del motivo
     nueva_cita = Appointment(
+        resource_id=appt.resource_id,
         date=date_obj,
         time=time_obj,
+        end_time=end_obj,
         user_id=current_user.id,
         reason_id=reason_obj.id if reason_obj else None
     )
 
     db.add(nueva_cita)
+    record_booking(db, date_obj, nueva_cita.reason_id, 1)
+    touch_calendar(db, current_user.id)
     db.commit()
     db.refresh(nueva_cita)
+    availability_index.book(appt.resource_id, date_obj, time_obj, duration)
+    notify_slot_change(appt.resource_id, date_obj, time_obj, duration)
 
     # ✅ Enviar correo al usuario (en segundo plano)
     subject = "Confirmación de tu cita"
@@ -122,13 +321,13 @@ async def create_appointment(
     <h3>Hola {current_user.full_name} 👋</h3>
     <p>Tu cita ha sido agendada correctamente.</p>
     <p><b>Fecha:</b> {appt.date}<br>
-    <b>Hora:</b> {appt.time}</p>
+    <b>Hora:</b> {appt.time} - {end_obj.strftime("%H:%M")}</p>
     <p><b>Motivo:</b> {reason_obj.name if reason_obj else "Sin motivo"}</p>
     <p>Por favor llega 10 minutos antes de tu cita. ¡Nos vemos pronto!</p>
     """
 
     # Enviar el correo sin bloquear la respuesta
-    asyncio.create_task(send_email(current_user.email, subject, body))
+    background_tasks.add_task(send_email, current_user.email, subject, body)
 
     return {
         "message": "Cita creada correctamente",
@@ -141,9 +340,10 @@ async def create_appointment(
     }
 
 
-@router.post("/cancel/{appointment_id}")
+@router.post("/cancel/{appointment_id}", response_model=MessageOut)
 def cancel_appointment(
     appointment_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_cookie)
 ):
@@ -151,7 +351,238 @@ def cancel_appointment(
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
+    # Liberar la plaza, borrar la cita y promover al siguiente en espera
+    # dentro de la misma transacción. El día del recurso se bloquea primero,
+    # en el mismo orden que la reserva (día → horario → estadísticas)
+    resource_id, cita_date, cita_time = cita.resource_id, cita.date, cita.time
+    lock_resource_days(db, [(resource_id, cita_date)])
+    duration = appointment_minutes(cita.time, cita.end_time)
+    release_seat(db, resource_id, cita_date, cita_time)
+    record_booking(db, cita_date, cita.reason_id, -1)
+    touch_calendar(db, current_user.id)
     db.delete(cita)
+    promovida = promote_from_waitlist(db, resource_id, cita_date, cita_time)
+    email = promotion_email(promovida) if promovida else None
     db.commit()
 
+    availability_index.release(resource_id, cita_date, cita_time, duration)
+    if promovida:
+        # La plaza pasó directamente a otra persona (quizá con otra duración)
+        promoted_duration = appointment_minutes(promovida.time, promovida.end_time)
+        availability_index.book(resource_id, cita_date, cita_time, promoted_duration)
+        duration = max(duration, promoted_duration)
+        background_tasks.add_task(send_email, *email)
+    notify_slot_change(resource_id, cita_date, cita_time, duration)
+
     return {"message": "Cita cancelada correctamente"}
+
+
+# 4️⃣ Usuario — Reprogramar una cita en una sola transacción
+@router.post(
+    "/reschedule/{appointment_id}",
+    response_model=AppointmentCreateOut,
+    response_model_exclude_none=True
+)
+def reschedule_appointment(
+    appointment_id: int,
+    data: AppointmentReschedule,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    try:
+        new_date = datetime.strptime(data.date, "%Y-%m-%d").date()
+        new_time = datetime.strptime(data.time, "%H:%M").time()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha u hora inválido")
+
+    # Bloquear la fila para que dos reprogramaciones no se pisen
+    cita = (
+        db.query(Appointment)
+        .filter_by(id=appointment_id, user_id=current_user.id)
+        .with_for_update()
+        .first()
+    )
+    if not cita:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+
+    old_resource, old_date, old_time = cita.resource_id, cita.date, cita.time
+    new_resource = data.resource_id or old_resource
+    if new_resource != old_resource:
+        _check_resource(db, new_resource)
+    duration = appointment_minutes(cita.time, cita.end_time)
+    try:
+        new_end = appointment_end(new_time, duration)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    if (old_resource, old_date, old_time) == (new_resource, new_date, new_time):
+        db.rollback()
+        return {"error": "La cita ya está en ese horario"}
+
+    cita_existente = db.query(Appointment.id).filter(
+        Appointment.user_id == current_user.id,
+        Appointment.date == new_date,
+        Appointment.time == new_time,
+        Appointment.id != cita.id  # cambiar solo de profesional no choca consigo misma
+    ).first()
+    if cita_existente:
+        db.rollback()
+        return {"error": "Ya tienes una cita en este horario"}
+
+    # La base de datos decide el conflicto: solapes con ambos días bloqueados
+    # (en orden fijo) y UPDATE condicional sobre el nuevo horario
+    lock_resource_days(db, [(old_resource, old_date), (new_resource, new_date)])
+    if (
+        has_overlap(db, new_resource, new_date, new_time, new_end, exclude_id=cita.id)
+        or not reserve_seat(db, new_resource, new_date, new_time)
+    ):
+        db.rollback()
+        return {"error": "Horario no disponible"}
+
+    release_seat(db, old_resource, old_date, old_time)
+    record_booking(db, old_date, cita.reason_id, -1)
+    record_booking(db, new_date, cita.reason_id, 1)
+    touch_calendar(db, current_user.id)
+    cita.resource_id = new_resource
+    cita.date = new_date
+    cita.time = new_time
+    cita.end_time = new_end
+    db.flush()
+    promovida = promote_from_waitlist(db, old_resource, old_date, old_time)
+    email = promotion_email(promovida) if promovida else None
+    db.commit()
+
+    # Actualizar el índice de ambas fechas en un solo paso
+    availability_index.move(
+        (old_resource, old_date, old_time), (new_resource, new_date, new_time), duration
+    )
+    old_span = duration
+    if promovida:
+        promoted_duration = appointment_minutes(promovida.time, promovida.end_time)
+        availability_index.book(old_resource, old_date, old_time, promoted_duration)
+        old_span = max(duration, promoted_duration)
+        background_tasks.add_task(send_email, *email)
+    notify_slot_change(old_resource, old_date, old_time, old_span)
+    notify_slot_change(new_resource, new_date, new_time, duration)
+
+    reason_name = cita.reason.name if cita.reason else "Sin motivo"
+
+    # ✅ Un único correo con el cambio
+    subject = "Tu cita ha sido reprogramada"
+    body = f"""
+    <h3>Hola {current_user.full_name} 👋</h3>
+    <p>Tu cita ha sido reprogramada correctamente.</p>
+    <p><b>Antes:</b> {old_date.strftime("%Y-%m-%d")} {old_time.strftime("%H:%M")}<br>
+    <b>Ahora:</b> {data.date} {data.time}</p>
+    <p><b>Motivo:</b> {reason_name}</p>
+    <p>Por favor llega 10 minutos antes de tu cita. ¡Nos vemos pronto!</p>
+    """
+    background_tasks.add_task(send_email, current_user.email, subject, body)
+
+    return {
+        "message": "Cita reprogramada correctamente",
+        "appointment": {
+            "date": data.date,
+            "time": data.time,
+            "reason": reason_name,
+            "user": current_user.full_name
+        }
+    }
+
+
+# 5️⃣ Usuario — Lista de espera de un horario completo
+@router.post("/waitlist", response_model=WaitlistJoinOut, response_model_exclude_none=True)
+def join_waitlist(
+    appt: AppointmentCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    try:
+        date_obj = datetime.strptime(appt.date, "%Y-%m-%d").date()
+        time_obj = datetime.strptime(appt.time, "%H:%M").time()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha u hora inválido")
+
+    slot = db.query(AvailableSlot).filter(
+        AvailableSlot.resource_id == appt.resource_id,
+        AvailableSlot.date == date_obj,
+        AvailableSlot.time == time_obj
+    ).first()
+    if not slot:
+        raise HTTPException(status_code=404, detail="Horario no encontrado")
+
+    if slot.booked_count < slot.capacity:
+        return {"error": "Hay plazas libres: reserva directamente"}
+
+    ya_tiene_cita = db.query(Appointment.id).filter(
+        Appointment.user_id == current_user.id,
+        Appointment.date == date_obj,
+        Appointment.time == time_obj
+    ).first()
+    if ya_tiene_cita:
+        return {"error": "Ya tienes una cita en este horario"}
+
+    ya_en_espera = db.query(WaitlistEntry.id).filter_by(
+        slot_id=slot.id, user_id=current_user.id
+    ).first()
+    if ya_en_espera:
+        return {"error": "Ya estás en la lista de espera de este horario"}
+
+    reason_obj = _find_reason(db, appt.reason)
+    entry = WaitlistEntry(
+        slot_id=slot.id,
+        user_id=current_user.id,
+        reason_id=reason_obj.id if reason_obj else None
+    )
+    db.add(entry)
+    db.commit()
+    db.refresh(entry)
+
+    # Puesto = entradas por delante o igual en el orden de promoción, no el total:
+    # con altas simultáneas el total también cuenta a quien llegó después
+    position = db.query(WaitlistEntry).filter(
+        WaitlistEntry.slot_id == slot.id,
+        tuple_(WaitlistEntry.created_at, WaitlistEntry.id) <= tuple_(entry.created_at, entry.id)
+    ).count()
+    return {"message": "Te avisaremos si se libera una plaza", "position": position}
+
+
+@router.get("/waitlist", response_model=List[WaitlistEntryOut])
+def my_waitlist(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    rows = (
+        db.query(
+            WaitlistEntry.id, AvailableSlot.resource_id, AvailableSlot.date, AvailableSlot.time, Reason.name
+        )
+        .join(AvailableSlot, AvailableSlot.id == WaitlistEntry.slot_id)
+        .outerjoin(Reason, Reason.id == WaitlistEntry.reason_id)
+        .filter(WaitlistEntry.user_id == current_user.id)
+        .order_by(AvailableSlot.date, AvailableSlot.time)
+        .all()
+    )
+    return [
+        {
+            "id": r[0],
+            "resource_id": r[1],
+            "date": r[2],
+            "time": r[3].isoformat(timespec="minutes"),
+            "reason": r[4] or "Sin motivo"
+        }
+        for r in rows
+    ]
+
+
+@router.post("/waitlist/leave/{entry_id}", response_model=MessageOut)
+def leave_waitlist(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    deleted = db.query(WaitlistEntry).filter_by(id=entry_id, user_id=current_user.id).delete()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Entrada no encontrada")
+    db.commit()
+    return {"message": "Has salido de la lista de espera"}
@@ -0,0 +1,121 @@
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import get_db, SessionLocal
+from app.models import Appointment, Reason, User
+from app.auth import get_current_user_from_cookie
+from app.core.calendar_feed import (
+    ALL_SCOPE,
+    feed_token,
+    user_id_from_feed_token,
+    user_scope,
+    get_stamp,
+    stamp_etag,
+    render_calendar
+)
+
+router = APIRouter(prefix="/calendar", tags=["Calendario"])
+
+STREAM_BATCH = 500
+
+
+# ------------------------------------------
+# Helpers
+# ------------------------------------------
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [t.strip() for t in if_none_match.split(",")]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _feed_response(request: Request, db: Session, scope: str, name: str, user_id=None):
+    stamp = get_stamp(db, scope)
+    etag = stamp_etag(stamp)
+    last_modified = stamp.updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "private, max-age=300",
+    }
+
+    # 🔁 Nada cambió: 304 sin tocar las citas
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    def generate():
+        # El feed se transmite después de cerrar la sesión de la petición: usa la suya
+        stream_db = SessionLocal()
+        try:
+            query = (
+                stream_db.query(
+                    Appointment.id, Appointment.date, Appointment.time, Appointment.end_time,
+                    Reason.name, User.full_name
+                )
+                .join(User, User.id == Appointment.user_id)
+                .outerjoin(Reason, Reason.id == Appointment.reason_id)
+                .order_by(Appointment.date, Appointment.time)
+            )
+            if user_id is not None:
+                query = query.filter(Appointment.user_id == user_id)
+            rows = query.yield_per(STREAM_BATCH)
+            if user_id is not None:
+                # En el feed personal no hace falta repetir el nombre del usuario
+                rows = ((r[0], r[1], r[2], r[3], r[4], None) for r in rows)
+            yield from render_calendar(name, stamp, rows)
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(generate(), media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+def _user_from_token(db: Session, token: str) -> User:
+    user_id = user_id_from_feed_token(token)
+    user = db.get(User, user_id) if user_id else None
+    if not user:
+        raise HTTPException(status_code=404, detail="Calendario no encontrado")
+    return user
+
+
+# ------------------------------------------
+# GET: Enlaces de suscripción del usuario actual
+# ------------------------------------------
+@router.get("/links")
+def calendar_links(request: Request, current_user: User = Depends(get_current_user_from_cookie)):
+    base = str(request.base_url).rstrip("/")
+    token = feed_token(current_user.id)
+    links = {"user": f"{base}/calendar/user/{token}.ics"}
+    if current_user.is_admin:
+        links["admin"] = f"{base}/calendar/admin/{token}.ics"
+    return links
+
+
+# ------------------------------------------
+# GET: Feed .ics del usuario
+# ------------------------------------------
+@router.get("/user/{token}.ics")
+def user_feed(token: str, request: Request, db: Session = Depends(get_db)):
+    user = _user_from_token(db, token)
+    return _feed_response(request, db, user_scope(user.id), "Mis citas", user_id=user.id)
+
+
+# ------------------------------------------
+# GET: Feed .ics con todas las citas (solo admin)
+# ------------------------------------------
+@router.get("/admin/{token}.ics")
+def admin_feed(token: str, request: Request, db: Session = Depends(get_db)):
+    user = _user_from_token(db, token)
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="No tienes permisos de administrador.")
+    return _feed_response(request, db, ALL_SCOPE, "Citas — Administración")
@@ -1,11 +1,17 @@
+from typing import List
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Reason
+from app.models import Reason, Resource
+from app.schemas import ReasonOut, ResourceOut
 
 router = APIRouter()
 
-@router.get("/reasons")
+@router.get("/reasons", response_model=List[ReasonOut])
 def get_public_reasons(db: Session = Depends(get_db)):
-    reasons = db.query(Reason).all()
-    return [{"id": r.id, "name": r.name} for r in reasons]
\ No newline at end of file
+    return db.query(Reason).all()
+
+
+@router.get("/resources", response_model=List[ResourceOut])
+def get_public_resources(db: Session = Depends(get_db)):
+    return db.query(Resource).filter(Resource.is_active.is_(True)).order_by(Resource.id).all()
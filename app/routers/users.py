@@ -1,21 +1,29 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
-from app.models import AvailableSlot
+from app.models import AvailableSlot, DEFAULT_DURATION_MINUTES
 from app.auth import get_current_user_from_cookie
 from sqlalchemy.orm import Session
 from app.auth import (
     verify_password,
     get_password_hash,
-    create_access_token,
     decode_access_token,
-    get_current_user
+    get_current_user,
+    issue_session,
+    rotate_refresh_token,
+    revoke_refresh_token,
+    set_session_cookies,
+    create_access_token
 )
 from app.database import get_db
-from app.models import User, Appointment
+from app.core.static_assets import static_url
+from app.models import User, Appointment, Reason
+from app.schemas import UserOut, AdminRegisterOut, ReasonOut, MessageOut
+from typing import List
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_url
 
 # ------------------------------------------
 # GET: Mostrar formulario de inicio de sesión
@@ -64,15 +72,12 @@ def login(
     print("🛡️ Es admin:", user.is_admin)
 
     try:
-        # Crear token
-        token = create_access_token(data={"sub": str(user.id)})
-
         # Redirigir según rol
         redirect_url = "/admin/create-slot" if user.is_admin else "/"
         response = RedirectResponse(url=redirect_url, status_code=302)
 
-        # Guardar token en cookie
-        response.set_cookie(key="access_token", value=token, httponly=True)
+        # Guardar access token corto + refresh token en cookies
+        issue_session(db, response, user.id)
         return response
 
     except Exception as e:
@@ -87,7 +92,7 @@ def login(
 # POST: Registrar un usuario admin (para pruebas)
 # ------------------------------------------
     
-@router.post("/register-admin")
+@router.post("/register-admin", response_model=AdminRegisterOut, response_model_exclude_none=True)
 def register_admin(
     full_name: str = Form(...),
     email: str = Form(...),
@@ -204,7 +209,8 @@ def index(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("index.html", {
         "request": request,
         "full_name": full_name,
-        "available_slots": available_slots
+        "available_slots": available_slots,
+        "default_duration": DEFAULT_DURATION_MINUTES  # 👈 duración de una cita sin motivo
     })
 
 
@@ -212,17 +218,43 @@ def index(request: Request, db: Session = Depends(get_db)):
 # GET: Cerrar sesión (borrar cookie)
 # ------------------------------------------
 @router.get("/logout")
-def logout(request: Request):
+def logout(request: Request, db: Session = Depends(get_db)):
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+        revoke_refresh_token(db, refresh_token)
+
     response = RedirectResponse(url="/users/login?logged_out=true", status_code=302)
     response.delete_cookie("access_token")
+    response.delete_cookie("refresh_token")
+    return response
+
+
+# ------------------------------------------
+# POST: Renovar la sesión con el refresh token (clientes API/móviles)
+# ------------------------------------------
+@router.post("/refresh", response_model=MessageOut)
+def refresh_session(request: Request, db: Session = Depends(get_db)):
+    refresh_token = request.cookies.get("refresh_token")
+    result = rotate_refresh_token(db, refresh_token) if refresh_token else None
+    if result is None:
+        raise HTTPException(status_code=401, detail="Sesión expirada")
+
+    user_id, new_refresh_token = result
+    response = ORJSONResponse({"message": "Sesión renovada"})
+    set_session_cookies(response, create_access_token(data={"sub": str(user_id)}), new_refresh_token)
     return response
 
 # ------------------------------------------
 # GET: Lista de usuarios (JSON)
 # ------------------------------------------
-@router.get("/users", tags=["Usuarios"])
+@router.get("/users", tags=["Usuarios"], response_model=List[UserOut])
 def list_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
+    # Solo las columnas públicas: nunca se expone hashed_password
+    rows = db.query(User.id, User.full_name, User.username, User.email, User.is_admin).all()
+    return ORJSONResponse([
+        {"id": r[0], "full_name": r[1], "username": r[2], "email": r[3], "is_admin": bool(r[4])}
+        for r in rows
+    ])
 
 # ------------------------------------------
 # GET: Página de "Mis citas" protegida
@@ -267,7 +299,6 @@ def admin_create_slot_page(
         raise HTTPException(status_code=403, detail="No tienes permisos.")
     return templates.TemplateResponse("admin_create_slot.html", {"request": request})
 
-@router.get("/reasons")
+@router.get("/reasons", response_model=List[ReasonOut])
 def get_public_reasons(db: Session = Depends(get_db)):
-    reasons = db.query(Reason).all()
-    return [{"id": r.id, "name": r.name} for r in reasons]
\ No newline at end of file
+    return db.query(Reason).all()
\ No newline at end of file
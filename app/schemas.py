@@ -1,7 +1,8 @@
 # app/schemas.py
 from pydantic import BaseModel, EmailStr
-from datetime import date, time
-from typing import Optional
+from datetime import date, time, datetime
+from typing import Optional, List, Any, Dict
+from app.models import DEFAULT_RESOURCE_ID, DEFAULT_DURATION_MINUTES
 
 class UserCreate(BaseModel):
     full_name: str
@@ -15,17 +16,19 @@ class UserLogin(BaseModel):
 
 class UserOut(BaseModel):
     id: int
-    full_name: str
+    full_name: Optional[str] = None
     username: str
     email: str
+    is_admin: bool = False
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class AppointmentCreate(BaseModel):
     date: str
     time: str
     reason: Optional[str] = None
+    resource_id: int = DEFAULT_RESOURCE_ID
 
 class AppointmentOut(BaseModel):
     id: int
@@ -33,14 +36,166 @@ class AppointmentOut(BaseModel):
     time: str
     reason: str
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class AppointmentReschedule(BaseModel):
+    date: str  # formato "YYYY-MM-DD"
+    time: str  # formato "HH:MM"
+    resource_id: Optional[int] = None  # None = mismo recurso de la cita
 
 class SlotCreate(BaseModel):
     date: str  # formato "YYYY-MM-DD"
     time: str  # formato "HH:MM"
+    capacity: int = 1  # plazas disponibles en el horario
+    resource_id: int = DEFAULT_RESOURCE_ID
 
 class ReasonCreate(BaseModel):
     name: str
+    duration_minutes: int = DEFAULT_DURATION_MINUTES
+
+class ResourceCreate(BaseModel):
+    name: str
+    kind: str = "practitioner"  # "practitioner" o "room"
+
+
+# ========================
+# Modelos de respuesta
+# ========================
+class MessageOut(BaseModel):
+    message: str
+
+class SlotOut(BaseModel):
+    id: Optional[int] = None
+    resource_id: int
+    date: date
+    time: str  # formato "HH:MM"
+    capacity: int = 1
+    booked_count: int = 0
+
+class SlotCreatedOut(BaseModel):
+    message: str
+    slot: SlotOut
+
+class NextFreeSlotOut(BaseModel):
+    date: Optional[str] = None  # formato "YYYY-MM-DD"
+    time: Optional[str] = None
+
+class AppointmentSummary(BaseModel):
+    date: date
+    time: str
+    reason: str
+    user: Optional[str] = None
+
+class AppointmentCreateOut(BaseModel):
+    message: Optional[str] = None
+    error: Optional[str] = None
+    appointment: Optional[AppointmentSummary] = None
+
+class AdminAppointmentOut(BaseModel):
+    id: int
+    user_name: Optional[str] = None
+    resource_name: Optional[str] = None
+    date: date
+    time: str
+    end_time: Optional[str] = None
+    reason_name: str
+
+class ResourceOut(BaseModel):
+    id: int
+    name: str
+    kind: str
+
+    class Config:
+        from_attributes = True
+
+class ReasonOut(BaseModel):
+    id: int
+    name: str
+    duration_minutes: int
+
+    class Config:
+        from_attributes = True
+
+class ReasonAddedOut(BaseModel):
+    message: str
+    reason: str
+
+class AdminRegisterOut(BaseModel):
+    msg: Optional[str] = None
+    error: Optional[str] = None
+
+class WaitlistJoinOut(BaseModel):
+    message: Optional[str] = None
+    error: Optional[str] = None
+    position: Optional[int] = None
+
+class WaitlistEntryOut(BaseModel):
+    id: int
+    resource_id: int
+    date: date
+    time: str
+    reason: str
+
+class ReasonCountOut(BaseModel):
+    reason_id: Optional[int] = None
+    reason_name: str
+    booked: int
+
+class DailyStatsOut(BaseModel):
+    date: date
+    slots: int
+    capacity: int
+    booked: int
+    occupancy_rate: Optional[float] = None  # None si el día no tiene plazas registradas
+    by_reason: List[ReasonCountOut]
+
+class JobCreate(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    cancel_requested: bool
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class BulkBookingItem(BaseModel):
+    date: str  # YYYY-MM-DD
+    time: str  # HH:MM
+
+class BulkBookingCreate(BaseModel):
+    user_id: int
+    resource_id: int = DEFAULT_RESOURCE_ID
+    reason: Optional[str] = None  # id o nombre del motivo
+    items: List[BulkBookingItem]
+    repeat: int = 1        # ocurrencias de cada item (p. ej. 8 sesiones semanales)
+    every_days: int = 7    # días entre ocurrencias
+    all_or_nothing: bool = False
 
+class BulkCancelRequest(BaseModel):
+    ids: Optional[List[int]] = None
+    date: Optional[str] = None         # cancelar todo el día (cierre de la clínica)
+    resource_id: Optional[int] = None  # con `date`: solo ese recurso
+    promote_waitlist: bool = False
 
+class BulkItemResult(BaseModel):
+    id: Optional[int] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    ok: bool
+    error: Optional[str] = None
 
+class BulkResultOut(BaseModel):
+    message: str
+    applied: int
+    failed: int
+    results: List[BulkItemResult]